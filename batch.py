@@ -0,0 +1,210 @@
+import torch
+from typing import TYPE_CHECKING
+
+from simulation import Simulation
+from state import BatchBodyState
+from utils import dof_gravity, solve_batch, solve_schur_batch
+
+if TYPE_CHECKING:
+    from joints import BaseJoint
+    from objects import BaseObject
+
+
+class BatchSimulation(Simulation):
+    # B independent copies of a scene built on `simul`, stepped together.
+    # masses, body states and joint params may differ per world, the
+    # topology (bodies, joints, fixed flags) is shared
+    def __init__(self, simul: Simulation, batch_size: int):
+        super().__init__(
+            fps=simul.fps,
+            solver=simul.solver,
+            dt=simul.dt,
+            substeps=simul.substeps,
+            # all worlds are solved in batched calls, not island by island
+            threads=1,
+            dtype=simul.dtype
+        )
+        self._batch_size = batch_size
+        self._object_list = list(simul.objects)
+        self._joint_list = list(simul.joints)
+        self._state = BatchBodyState(simul.state, batch_size)
+        self._mass = self._state.mass.to(self._dtype) \
+            .expand(batch_size, -1).clone()
+
+        self._batch_params: list[dict[str, torch.Tensor]] = []
+        self._G_flat_indices = None
+        self._epsilon_mat = None
+        self.init()
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    @property
+    def mass(self) -> torch.Tensor:
+        return self._mass
+
+    def init(self) -> None:
+        super().init()
+
+        self._batch_params = [
+            {
+                key: value.expand(self._batch_size, *value.shape).clone()
+                for key, value in group.params.items()
+            }
+            for group in self._joint_groups
+        ]
+        rows, cols = self._G_indices
+        self._G_flat_indices = rows * len(self._free_dofs) + cols
+        # E couples the rows of an island only, as in Simulation
+        same_island = \
+            self._row_island.reshape(-1, 1) == self._row_island.reshape(1, -1)
+        self._epsilon_mat = same_island.to(self._dtype) * self._epsilon
+        self._lambda = torch.zeros(
+            (self._batch_size, self._num_constraints), dtype=self._dtype
+        )
+        self._update_mass()
+
+    def _build_system(self) -> None:
+        # update() assembles and solves all worlds at once, from the pattern
+        # of G alone. no tree solver, island solvers or step workspace
+        self._build_pattern()
+
+    # the topology is fixed once the worlds are built, see BatchBodyState
+    def add_object(self, *args, **kwargs) -> int:
+        raise RuntimeError("Bodies can not be added to a batched simulation")
+
+    def add_objects(self, *args, **kwargs) -> int:
+        raise RuntimeError("Bodies can not be added to a batched simulation")
+
+    def add_joint(self, *args, **kwargs) -> int:
+        raise RuntimeError("Joints can not be added to a batched simulation")
+
+    def add_joints(self, *args, **kwargs) -> int:
+        raise RuntimeError("Joints can not be added to a batched simulation")
+
+    # per-world parameters, `value` has a leading batch dimension. positions
+    # and orientations are set as initial conditions, at rest
+    def set_mass(self, obj: 'BaseObject', value: torch.Tensor) -> None:
+        self._mass[:, obj.index] = value
+        self._update_mass()
+
+    def set_pos(self, obj: 'BaseObject', value: torch.Tensor) -> None:
+        self._state.pos[:, obj.index] = value
+        self._state.pos_before[:, obj.index] = value
+        self._state.touch()
+
+    def set_dir(self, obj: 'BaseObject', value: torch.Tensor) -> None:
+        self._state.dir[:, obj.index] = value
+        self._state.dir_before[:, obj.index] = value
+        self._state.touch()
+
+    def set_joint_param(self,
+                        joint: 'BaseJoint',
+                        key: str,
+                        value: torch.Tensor) -> None:
+        for group, params in zip(self._joint_groups, self._batch_params):
+            if joint in group.joints:
+                params[key][:, group.joints.index(joint)] = value
+                return
+        raise KeyError("Joint not in this simulation")
+
+    def restore(self, blob: bytes) -> None:
+        super().restore(blob)
+        self._update_mass()
+
+    def _snapshot_tensors(self) -> list[torch.Tensor]:
+        state = self._state
+        return [
+            state.pos, state.pos_before, state.dir, state.dir_before,
+            state.force, self._lambda, self._mass
+        ] + [
+            value
+            for params in self._batch_params
+            for _, value in sorted(params.items())
+        ]
+
+    def _update_mass(self) -> None:
+        mass = self._mass.repeat_interleave(6, dim=1)
+        gravity = dof_gravity(mass)
+
+        self._M = mass[:, self._free_dofs]
+        self._M_inv = 1 / self._M
+        self._V_q = gravity[:, self._free_dofs].unsqueeze(-1)
+
+    def assemble_G(self) -> torch.Tensor:
+        values = torch.cat([
+            torch.cat(
+                group.joint_type.batch_G_blocks(
+                    self._state, group.idx1, group.idx2, params
+                ),
+                dim=-1
+            ).reshape(self._batch_size, -1)
+            for group, params in zip(self._joint_groups, self._batch_params)
+        ], dim=1)
+
+        num_rows, num_free = len(self._active_rows), len(self._free_dofs)
+        G = values.new_zeros((self._batch_size, num_rows * num_free))
+        G[:, self._G_flat_indices] = values[:, self._G_entries]
+        return G.reshape(self._batch_size, num_rows, num_free)
+
+    def update(self):
+        timer = self._profiler.begin('step')
+        batch_size = self._batch_size
+
+        v = self._state.v(self.h).reshape(batch_size, -1)
+        v = v[:, self._free_dofs].unsqueeze(-1)
+
+        g = torch.cat([
+            group.joint_type.batch_g(
+                self._state, group.idx1, group.idx2, params
+            ).reshape(batch_size, -1)
+            for group, params in zip(self._joint_groups, self._batch_params)
+        ], dim=1)
+        g = g[:, self._active_rows].unsqueeze(-1)
+
+        f = self._state.force.reshape(batch_size, -1)
+        f = f[:, self._free_dofs].unsqueeze(-1)
+        timer.lap('gather')
+
+        G = self.assemble_G()
+        timer.lap('jacobian')
+
+        B1 = self._M.unsqueeze(-1) * v - self.h * self._V_q + self.h * f
+        B2 = -4 * self._Lambda / self.h * g + self._Lambda * G @ v
+
+        # the batched worlds are small, 'cg' uses the direct Schur solve
+        if self._solver in ('schur', 'cg'):
+            timer.lap('system')
+            result = solve_schur_batch(
+                G, self._M_inv, self._epsilon_mat, B1, B2
+            )
+        else:
+            E = self._epsilon_mat.expand(batch_size, -1, -1)
+            A = torch.cat([
+                torch.cat([torch.diag_embed(self._M), -G.mT], dim=2),
+                torch.cat([G, E], dim=2)
+            ], dim=1)
+            timer.lap('system')
+            result = solve_batch(A, torch.cat([B1, B2], dim=1))
+        timer.lap('solve')
+
+        num_free = len(self._free_dofs)
+        v_next = result.new_zeros((batch_size, 6 * self.num_objects))
+        v_next[:, self._free_dofs] = result[:, :num_free]
+        self._lambda[:, self._lambda_rows] = result[:, num_free:]
+
+        self._state.integrate(v_next.reshape(batch_size, -1, 6), self.h)
+        self._num_steps += 1
+        timer.lap('integrate')
+
+        for observer in self._observers:
+            observer.on_step(self)
+        timer.lap('observers')
+
+        timer.end(
+            step=self._num_steps,
+            num_free=num_free,
+            num_rows=len(self._active_rows),
+            batch_size=batch_size
+        )
@@ -0,0 +1,195 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import torch
+from typing import Callable
+
+import scene
+from simulation import Simulation
+
+TOPOLOGIES: dict[str, Callable[[int, str], dict]] = scene.GENERATORS
+
+# measurement
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+def run_case(case: dict) -> dict:
+    torch.set_num_threads(case['threads'])
+
+    start = time.perf_counter()
+    simul = Simulation(
+        fps=60, solver=case['solver'], dtype=getattr(torch, case['dtype'])
+    )
+    scene.load(simul, TOPOLOGIES[case['topology']](
+        case['size'], case['joint']
+    ))
+    simul.init()
+    setup = time.perf_counter() - start
+
+    for _ in range(case['warmup']):
+        simul.update()
+
+    latencies = []
+    deadline = time.perf_counter() + case['max_seconds']
+    for _ in range(case['steps']):
+        start = time.perf_counter()
+        simul.update()
+        latencies.append(time.perf_counter() - start)
+        if time.perf_counter() > deadline:
+            break
+
+    total = sum(latencies)
+    return {
+        **case,
+        'bodies': simul.num_objects,
+        'joints': simul.num_joints,
+        'constraints': simul.num_constraints,
+        'steps_run': len(latencies),
+        'setup_s': setup,
+        'steps_per_s': len(latencies) / total if total else float('inf'),
+        'latency_p50_ms': 1e3 * percentile(latencies, 50),
+        'latency_p90_ms': 1e3 * percentile(latencies, 90),
+        'latency_p99_ms': 1e3 * percentile(latencies, 99),
+        'latency_max_ms': 1e3 * max(latencies),
+        # ru_maxrss is in KiB on Linux, bytes on macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            / (2 ** 20 if platform.system() == 'Darwin' else 2 ** 10),
+    }
+
+# cold start: what a fresh worker process pays before its first step.
+# torch is timed on its own, the budget covers the physics modules only
+CORE_MODULES = ['simulation', 'objects', 'joints', 'batch', 'recorder',
+                'scene', 'sweep']
+IMPORT_PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import torch
+torch_done = time.perf_counter()
+import {', '.join(CORE_MODULES)}
+end = time.perf_counter()
+print(torch_done - start, end - torch_done, 'vpython' in sys.modules)
+"""
+
+def measure_imports(repeats: int=5) -> dict:
+    # best of `repeats` fresh interpreters, so a cold disk cache does not count
+    torch_times, core_times, vpython_loaded = [], [], False
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.split()
+        torch_times.append(float(output[0]))
+        core_times.append(float(output[1]))
+        vpython_loaded |= output[2] == 'True'
+    return {
+        'torch_import_ms': 1e3 * min(torch_times),
+        'core_import_ms': 1e3 * min(core_times),
+        'vpython_loaded': vpython_loaded,
+    }
+
+def run_isolated(case: dict) -> dict:
+    # a fresh process per case keeps peak memory attributable to the case
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(run_case, (case,))
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Step throughput benchmark')
+    parser.add_argument('--topologies', nargs='+', default=list(TOPOLOGIES),
+                        choices=list(TOPOLOGIES))
+    parser.add_argument('--joints', nargs='+', default=list(scene.JOINT_TYPES),
+                        choices=list(scene.JOINT_TYPES))
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[2, 8, 32, 128, 512, 2048])
+    parser.add_argument('--solver', default='schur',
+                        choices=['schur', 'dense', 'cg'])
+    parser.add_argument('--dtype', default='float64',
+                        choices=['float32', 'float64'])
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=30.0,
+                        help='stop measuring a case after this long')
+    parser.add_argument('--threads', type=int,
+                        default=torch.get_num_threads())
+    parser.add_argument('--import-budget', type=float, metavar='MS',
+                        help='only time the cold import of the physics '
+                        'modules, fail if it exceeds MS or loads vpython')
+    parser.add_argument('--in-process', action='store_true',
+                        help='no process per case, peak memory is shared')
+    parser.add_argument('--output', default='benchmark_results.jsonl',
+                        help='JSON lines file, results are appended')
+    args = parser.parse_args()
+
+    meta = {
+        'revision': git_revision(),
+        'torch': torch.__version__,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+    if args.import_budget is not None:
+        result = measure_imports()
+        result.update(meta, import_budget_ms=args.import_budget)
+        with open(args.output, 'a') as file:
+            file.write(json.dumps(result) + '\n')
+        print(
+            f"torch {result['torch_import_ms']:9.1f} ms  "
+            f"core {result['core_import_ms']:7.1f} ms  "
+            f"(budget {args.import_budget:.1f} ms)  "
+            f"vpython {'loaded' if result['vpython_loaded'] else 'not loaded'}"
+        )
+        if result['vpython_loaded'] \
+                or result['core_import_ms'] > args.import_budget:
+            sys.exit(1)
+        return
+
+    with open(args.output, 'a') as file:
+        for topology in args.topologies:
+            for joint in args.joints:
+                for size in args.sizes:
+                    case = {
+                        'topology': topology,
+                        'joint': joint,
+                        'size': size,
+                        'solver': args.solver,
+                        'dtype': args.dtype,
+                        'steps': args.steps,
+                        'warmup': args.warmup,
+                        'max_seconds': args.max_seconds,
+                        'threads': args.threads,
+                    }
+                    result = run_case(case) if args.in_process \
+                        else run_isolated(case)
+                    result.update(meta)
+                    file.write(json.dumps(result) + '\n')
+                    file.flush()
+
+                    print(
+                        f"{topology:6} {joint:9} n={size:<5} "
+                        f"{result['steps_per_s']:10.1f} steps/s  "
+                        f"p50 {result['latency_p50_ms']:9.3f} ms  "
+                        f"p99 {result['latency_p99_ms']:9.3f} ms  "
+                        f"rss {result['peak_rss_mb']:8.1f} MB"
+                    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import torch
+
+from utils import csr_layout, sparse_csr
+
+class Island:
+    # a connected part of the reduced system: its free dofs, constraint
+    # rows and entries of G, with G's entries renumbered locally
+    def __init__(self,
+                 bodies: torch.Tensor,
+                 dofs: torch.Tensor,
+                 rows: torch.Tensor,
+                 entries: torch.Tensor,
+                 indices: torch.Tensor,
+                 epsilon: float,
+                 dtype: torch.dtype=torch.float64):
+        self._bodies = bodies
+        self._dofs = dofs
+        self._rows = rows
+        self._entries = entries
+        self._indices = indices
+        self._epsilon = epsilon
+        self._dtype = dtype
+        self._epsilon_mat = None
+        self._kkt = None
+        self._kkt_G = None
+        self._kkt_G_T = None
+        self._rhs = None
+        self._G_csr = None
+        self._G_T_csr = None
+        self._csr_entries = None
+        self._csr_T_entries = None
+
+    @property
+    def bodies(self) -> torch.Tensor:
+        return self._bodies
+
+    @property
+    def dofs(self) -> torch.Tensor:
+        return self._dofs
+
+    @property
+    def rows(self) -> torch.Tensor:
+        return self._rows
+
+    @property
+    def entries(self) -> torch.Tensor:
+        return self._entries
+
+    @property
+    def indices(self) -> torch.Tensor:
+        return self._indices
+
+    # built on first use, the iterative solver never needs it
+    @property
+    def epsilon_mat(self) -> torch.Tensor:
+        if self._epsilon_mat is None:
+            self._epsilon_mat = \
+                torch.full((len(self._rows), len(self._rows)), self._epsilon,
+                           dtype=self._dtype)
+        return self._epsilon_mat
+
+    @property
+    def num_rows(self) -> int:
+        return len(self._rows)
+
+    # dense [[M, -G^T], [G, E]] of the direct solver. the constant blocks
+    # are written on first use, later calls only overwrite G's entries
+    def kkt_matrix(self,
+                   M: torch.Tensor,
+                   values: torch.Tensor) -> torch.Tensor:
+        if self._kkt is None:
+            n, size = len(self._dofs), len(self._dofs) + len(self._rows)
+            self._kkt = torch.zeros((size, size), dtype=self._dtype)
+            self._kkt[:n, :n] = torch.diag(M[self._dofs])
+            self._kkt[n:, n:] = self.epsilon_mat
+            rows, cols = self._indices
+            self._kkt_G = (n + rows) * size + cols
+            self._kkt_G_T = cols * size + n + rows
+
+        island_values = values[self._entries]
+        flat = self._kkt.view(-1)
+        flat[self._kkt_G] = island_values
+        flat[self._kkt_G_T] = -island_values
+        return self._kkt
+
+    def kkt_rhs(self, B1: torch.Tensor, B2: torch.Tensor) -> torch.Tensor:
+        # [B1, B2] of the island's dofs and rows
+        if self._rhs is None:
+            self._rhs = torch.zeros(
+                (len(self._dofs) + len(self._rows), 1), dtype=self._dtype
+            )
+        n = len(self._dofs)
+        torch.index_select(B1, 0, self._dofs, out=self._rhs[:n])
+        torch.index_select(B2, 0, self._rows, out=self._rhs[n:])
+        return self._rhs
+
+    def G(self, values: torch.Tensor) -> torch.Tensor:
+        # the island's block of G from the values of all reduced entries
+        return torch.sparse_coo_tensor(
+            self._indices,
+            values[self._entries],
+            (len(self._rows), len(self._dofs)),
+            check_invariants=False
+        )
+
+    def build_csr(self) -> None:
+        # the CSR layouts of G and G^T for G_csr, once per topology
+        rows, cols = self._indices
+        shape = (len(self._rows), len(self._dofs))
+        crow, col, order = csr_layout(self._indices, shape)
+        crow_T, col_T, order_T = \
+            csr_layout(torch.vstack([cols, rows]), shape[::-1])
+        self._csr_entries = self._entries[order]
+        self._csr_T_entries = self._entries[order_T]
+
+        def matrix(crow: torch.Tensor,
+                   col: torch.Tensor,
+                   shape: tuple[int, int]) -> torch.Tensor:
+            values = torch.zeros((len(col),), dtype=self._dtype)
+            return sparse_csr(crow, col, values, shape)
+
+        self._G_csr = matrix(crow, col, shape)
+        self._G_T_csr = matrix(crow_T, col_T, shape[::-1])
+
+    def G_csr(self,
+              values: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        # the island's G and G^T as CSR, build_csr has to be called first.
+        # only the values are written, both are overwritten by the next call
+        torch.index_select(
+            values, 0, self._csr_entries, out=self._G_csr.values()
+        )
+        torch.index_select(
+            values, 0, self._csr_T_entries, out=self._G_T_csr.values()
+        )
+        return self._G_csr, self._G_T_csr
+
+    @staticmethod
+    def find(num_bodies: int,
+             free_dofs: torch.Tensor,
+             G_indices: torch.Tensor,
+             epsilon: float,
+             dtype: torch.dtype=torch.float64) -> list['Island']:
+        # connected components of the reduced system. two bodies share an
+        # island if some constraint row has entries on both, so bodies
+        # without free dofs never merge islands
+        rows, cols = G_indices
+        dof_body = free_dofs // 6
+        entry_body = dof_body[cols]
+        num_rows = int(rows.max()) + 1 if len(rows) else 0
+
+        # a row belongs to one joint, so it links at most two bodies: the
+        # first and the last one it has entries on
+        first = torch.full((num_rows,), num_bodies).scatter_reduce(
+            0, rows, entry_body, 'amin'
+        )
+        last = torch.full((num_rows,), -1).scatter_reduce(
+            0, rows, entry_body, 'amax'
+        )
+        links = torch.unique(
+            (first * num_bodies + last)[first != last]
+        )
+
+        parent = list(range(num_bodies))
+
+        def find_root(body: int) -> int:
+            while parent[body] != body:
+                parent[body] = parent[parent[body]]
+                body = parent[body]
+            return body
+
+        for link in links.tolist():
+            root1 = find_root(link // num_bodies)
+            root2 = find_root(link % num_bodies)
+            if root1 != root2:
+                parent[root2] = root1
+
+        # every island is labelled by its first body
+        roots = torch.as_tensor(
+            [find_root(body) for body in range(num_bodies)]
+        )
+        body_label = torch.full((num_bodies,), num_bodies).scatter_reduce(
+            0, roots, torch.arange(num_bodies), 'amin'
+        )[roots]
+        dof_label = body_label[dof_body]
+        row_label = torch.full((num_rows,), -1)
+        row_label[rows] = dof_label[cols]
+        entry_label = row_label[rows]
+
+        bodies, _ = Island._split(body_label)
+        dofs, dof_local = Island._split(dof_label)
+        island_rows, row_local = Island._split(row_label)
+        entries, _ = Island._split(entry_label)
+        indices = torch.vstack([row_local[rows], dof_local[cols]])
+
+        # one island per label with free dofs, in the order of the labels.
+        # a body without joints has no rows
+        none = rows.new_zeros((0,))
+        return [
+            Island(
+                bodies[label],
+                island_dofs,
+                island_rows.get(label, none),
+                entries.get(label, none),
+                indices[:, entries.get(label, none)],
+                epsilon,
+                dtype
+            )
+            for label, island_dofs in dofs.items()
+        ]
+
+    @staticmethod
+    def _split(label: torch.Tensor) -> tuple[dict, torch.Tensor]:
+        # the indices of every label in increasing order, and the position
+        # of every index among those of its label
+        if len(label) and bool((label == label[0]).all()):
+            # a single island, nothing to sort
+            index = torch.arange(len(label))
+            return {int(label[0]): index}, index
+        order = torch.argsort(label, stable=True)
+        values, counts = torch.unique_consecutive(
+            label[order], return_counts=True
+        )
+        local = torch.empty_like(order)
+        local[order] = torch.arange(len(order)) \
+            - (torch.cumsum(counts, 0) - counts).repeat_interleave(counts)
+        return dict(zip(values.tolist(), order.split(counts.tolist()))), local
@@ -1,4 +1,5 @@
 from .base_joint import BaseJoint
+from .joint_group import JointGroup
 
 from .ball_joint import BallJoint
 from .fixed_joint import FixedJoint
@@ -1,87 +1,69 @@
 import torch
-from typing import Union, Iterable, TYPE_CHECKING
-from vpython import *
+from typing import Iterable, TYPE_CHECKING
 
-from objects import BaseObject
 from joints import BaseJoint
 from utils import *
 
 if TYPE_CHECKING:
     from simulation import Simulation
     from objects import BaseObject
+    from state import BodyState
 
 class BallJoint(BaseJoint):
+    num_rows = 3
+
     def __init__(self,
                  simul: 'Simulation',
                  obj1: 'BaseObject',
                  obj2: 'BaseObject',
-                 pos: Union[vector, Iterable]=(0, 0, 0),
+                 pos: Iterable=(0, 0, 0),
                  size: float=0.2,
-                 col: color=color.white):
+                 col: Iterable=(1, 1, 1)):
         super().__init__(
             simul=simul,
             obj1=obj1,
-            obj2=obj2
-        )
-        self._pos = convert_to_tensor(pos)
-        self._pos_from_obj1 = self._pos - obj1.pos
-        self._pos_from_obj2 = self._pos - obj2.pos
-
-        self._ball = sphere(
-            pos=convert_to_vector(self._pos),
-            color=col,
-            size=vector(size, size, size) * 2
-        )
-        self._arm1 = cylinder(
-            pos=convert_to_vector(self._pos),
-            axis=convert_to_vector(obj1.pos - self._pos),
-            radius=size,
-            color=obj1.color
-        )
-        self._arm2 = cylinder(
-            pos=convert_to_vector(self._pos),
-            axis=convert_to_vector(obj2.pos - self._pos),
-            radius=size,
-            color=obj2.color
+            obj2=obj2,
+            size=size,
+            col=col
         )
+        self._init_params(pos=convert_to_tensor(pos, simul.dtype))
 
+    # current world position of the joint
     @property
-    def g(self) -> torch.Tensor:
-        return \
-            self._obj1.to_global(self._pos_from_obj1) \
-          - self._obj2.to_global(self._pos_from_obj2)
+    def pos(self) -> torch.Tensor:
+        return self._obj1.to_global(self.params['pos_from_obj1'])
 
-    @property
-    def G(self) -> torch.Tensor:
-        res = torch.zeros((3, 6 * self._simul.num_objects))
+    @classmethod
+    def batch_params(cls,
+                     state: 'BodyState',
+                     idx1: torch.Tensor,
+                     idx2: torch.Tensor,
+                     size: torch.Tensor,
+                     pos: torch.Tensor) -> dict[str, torch.Tensor]:
+        return {
+            'pos_from_obj1': pos - state.pos[idx1],
+            'pos_from_obj2': pos - state.pos[idx2]
+        }
 
-        idx1 = self._obj1.index
-        idx2 = self._obj2.index
+    @classmethod
+    def batch_g(cls,
+                state: 'BodyState',
+                idx1: torch.Tensor,
+                idx2: torch.Tensor,
+                params: dict[str, torch.Tensor]) -> torch.Tensor:
+        return cls.anchor_residual(
+            state, idx1, idx2, params['pos_from_obj1'], params['pos_from_obj2']
+        )
 
-        pos_from_obj1 = self._pos - self._obj1.pos
-        pos_from_obj2 = self._pos - self._obj2.pos
+    @classmethod
+    def batch_G_blocks(cls,
+                       state: 'BodyState',
+                       idx1: torch.Tensor,
+                       idx2: torch.Tensor,
+                       params: dict[str, torch.Tensor]
+                       ) -> tuple[torch.Tensor, torch.Tensor]:
+        pos = state.pos[..., idx1, :] \
+            + mat_vec(state.rot_mat[..., idx1, :, :], params['pos_from_obj1'])
 
         # translation constraints
-        res[0:3, 6 * idx1: 6 * idx1 + 6] = torch.concatenate([
-            self._obj1.lin_vel_coeff_mat,
-            -skew_matrix(pos_from_obj1) @ self._obj1.ang_vel_coeff_mat
-        ], axis=1)
-
-        res[0:3, 6 * idx2: 6 * idx2 + 6] = torch.concatenate([
-            -self._obj2.lin_vel_coeff_mat,
-            skew_matrix(pos_from_obj2) @ self._obj2.ang_vel_coeff_mat
-        ], axis=1)
-
-        return res
-    
-    def update(self):
-        self._pos = self._obj1.to_global(self._pos_from_obj1)
-        self._ball.pos = convert_to_vector(self._pos)
-
-        self._arm1.pos = convert_to_vector(self._pos)
-        self._arm1.axis = convert_to_vector(self._obj1.pos - self._pos)
-
-        self._arm2.pos = convert_to_vector(self._pos)
-        self._arm2.axis = convert_to_vector(self._obj2.pos - self._pos)
-    
-
+        return cls.translation_blocks(state, idx1, idx2, pos)
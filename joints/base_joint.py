@@ -1,28 +1,234 @@
+import inspect
 import torch
-from typing import TYPE_CHECKING
-from vpython import *
+from typing import Iterable, Optional, TYPE_CHECKING
+
+from joints.joint_group import JointGroup
+from utils import convert_to_tensor, gc_paused, skew_matrix, mat_vec
 
 if TYPE_CHECKING:
     from simulation import Simulation
     from objects import BaseObject
+    from state import BodyState
 
 class BaseJoint:
+    num_rows: int = 0
+
     def __init__(self,
                  simul: 'Simulation',
                  obj1: 'BaseObject',
-                 obj2: 'BaseObject'):
+                 obj2: 'BaseObject',
+                 size: float=0.2,
+                 col: Iterable=(1, 1, 1)):
         self._simul = simul
         self._index = simul.add_joint(self)
         self._obj1 = obj1
         self._obj2 = obj2
+        self._size = size
+        self._color = convert_to_tensor(col).tolist()
+        self._group: Optional[JointGroup] = None
+        self._group_index = 0
+
+    @property
+    def obj1(self) -> 'BaseObject':
+        return self._obj1
+
+    @property
+    def obj2(self) -> 'BaseObject':
+        return self._obj2
+
+    @property
+    def size(self) -> float:
+        return self._size
+
+    @property
+    def color(self) -> torch.Tensor:
+        return torch.as_tensor(self._color, dtype=torch.float64)
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    # the group holding the joint's params, and its row there
+    @property
+    def group(self) -> JointGroup:
+        return self._group
+
+    @property
+    def group_index(self) -> int:
+        return self._group_index
+
+    # constant per-joint data, views of the joint's row of its group
+    @property
+    def params(self) -> dict[str, torch.Tensor]:
+        return {
+            key: value[self._group_index]
+            for key, value in self._group.params.items()
+        }
 
     @property
     def g(self) -> torch.Tensor:
-        pass
-    
+        return self.batch_g(self._simul.state, *self._as_batch())[0]
+
+    @property
+    def G_blocks(self) -> tuple[torch.Tensor, torch.Tensor]:
+        block1, block2 = \
+            self.batch_G_blocks(self._simul.state, *self._as_batch())
+        return block1[0], block2[0]
+
     @property
     def G(self) -> torch.Tensor:
-        pass
+        block1, block2 = self.G_blocks
+        res = block1.new_zeros((len(block1), 6 * self._simul.num_objects))
+
+        idx1, idx2 = self.indices
+        res[:, 6 * idx1: 6 * idx1 + 6] = block1
+        res[:, 6 * idx2: 6 * idx2 + 6] = block2
+
+        return res
+
+    @property
+    def indices(self) -> tuple[int, int]:
+        return self._obj1.index, self._obj2.index
+
+    @classmethod
+    def create_many(cls,
+                    simul: 'Simulation',
+                    idx1: Iterable,
+                    idx2: Iterable,
+                    size: Optional[Iterable]=None,
+                    col: Optional[Iterable]=None,
+                    **columns: Iterable) -> list['BaseJoint']:
+        # k joints between the bodies idx1[i] and idx2[i] from (k x ...)
+        # columns, e.g. pos and axis. columns left out take the defaults of
+        # __init__, the params of all joints come from one batch_params call
+        # and the joints only keep plain values, no tensor is made per joint
+        defaults = inspect.signature(cls.__init__).parameters
+        idx1 = torch.as_tensor(idx1).reshape(-1)
+        idx2 = torch.as_tensor(idx2).reshape(-1)
+        k = len(idx1)
+
+        size = torch.as_tensor(
+            defaults['size'].default if size is None else size,
+            dtype=simul.dtype
+        ).expand(k)
+        col = torch.as_tensor(
+            defaults['col'].default if col is None else col,
+            dtype=torch.float64
+        ).expand(k, 3)
+        names = list(inspect.signature(cls.batch_params).parameters)[4:]
+        columns = {
+            name: torch.as_tensor(
+                columns.get(name, defaults[name].default), dtype=simul.dtype
+            ).expand(k, 3)
+            for name in names
+        }
+        params = cls.batch_params(simul.state, idx1, idx2, size, **columns)
+
+        with gc_paused():
+            joints = [cls.__new__(cls) for _ in range(k)]
+            start = simul.add_joints(joints)
+            # the tables become the params of the group as they are,
+            # joint i is its row i
+            group = JointGroup(joints, idx1, idx2, params)
+            objects = simul.objects
+            for i, joint, joint_idx1, joint_idx2, joint_size, joint_col \
+                    in zip(range(k), joints, idx1.tolist(), idx2.tolist(),
+                           size.tolist(), col.tolist()):
+                joint._simul = simul
+                joint._index = start + i
+                joint._obj1 = objects[joint_idx1]
+                joint._obj2 = objects[joint_idx2]
+                joint._size = joint_size
+                joint._color = joint_col
+                joint._group = group
+                joint._group_index = i
+        return joints
+
+    # constant per-joint data of k new joints from the state they are built
+    # in, the constructors compute theirs as a batch of one
+    @classmethod
+    def batch_params(cls,
+                     state: 'BodyState',
+                     idx1: torch.Tensor,
+                     idx2: torch.Tensor,
+                     size: torch.Tensor) -> dict[str, torch.Tensor]:
+        return {}
+
+    # batched evaluation over k joints of the same type, see JointGroup
+    @classmethod
+    def batch_g(cls,
+                state: 'BodyState',
+                idx1: torch.Tensor,
+                idx2: torch.Tensor,
+                params: dict[str, torch.Tensor]) -> torch.Tensor:
+        raise NotImplementedError
+
+    @classmethod
+    def batch_G_blocks(cls,
+                       state: 'BodyState',
+                       idx1: torch.Tensor,
+                       idx2: torch.Tensor,
+                       params: dict[str, torch.Tensor]
+                       ) -> tuple[torch.Tensor, torch.Tensor]:
+        raise NotImplementedError
+
+    # shared batched building blocks
+    @staticmethod
+    def anchor_residual(state: 'BodyState',
+                        idx1: torch.Tensor,
+                        idx2: torch.Tensor,
+                        pos_from_obj1: torch.Tensor,
+                        pos_from_obj2: torch.Tensor) -> torch.Tensor:
+        return \
+            state.pos[..., idx1, :] \
+          + mat_vec(state.rot_mat[..., idx1, :, :], pos_from_obj1) \
+          - state.pos[..., idx2, :] \
+          - mat_vec(state.rot_mat[..., idx2, :, :], pos_from_obj2)
+
+    @staticmethod
+    def translation_blocks(state: 'BodyState',
+                           idx1: torch.Tensor,
+                           idx2: torch.Tensor,
+                           pos: torch.Tensor
+                           ) -> tuple[torch.Tensor, torch.Tensor]:
+        pos_from_obj1 = pos - state.pos[..., idx1, :]
+        pos_from_obj2 = pos - state.pos[..., idx2, :]
+        ang_vel_coeff_mat1 = state.ang_vel_coeff_mat[..., idx1, :, :]
+        ang_vel_coeff_mat2 = state.ang_vel_coeff_mat[..., idx2, :, :]
+
+        block1 = torch.cat([
+            state.lin_vel_coeff_mat[..., idx1, :, :],
+            -skew_matrix(pos_from_obj1) @ ang_vel_coeff_mat1
+        ], dim=-1)
+
+        block2 = torch.cat([
+            -state.lin_vel_coeff_mat[..., idx2, :, :],
+            skew_matrix(pos_from_obj2) @ ang_vel_coeff_mat2
+        ], dim=-1)
+
+        return block1, block2
+
+    def set_group(self, group: JointGroup, index: int) -> None:
+        self._group = group
+        self._group_index = index
+
+    def _init_params(self, **columns: torch.Tensor) -> None:
+        # a group of one, merged with the others by JointGroup.group
+        idx1, idx2 = map(torch.as_tensor, self.indices)
+        idx1, idx2 = idx1.reshape(1), idx2.reshape(1)
+        JointGroup([self], idx1, idx2, self.batch_params(
+            self._simul.state,
+            idx1,
+            idx2,
+            torch.as_tensor([self._size], dtype=self._simul.dtype),
+            **{key: value.unsqueeze(0) for key, value in columns.items()}
+        )).bind()
 
-    def update(self) -> None:
-        pass
\ No newline at end of file
+    def _as_batch(self) -> tuple:
+        idx1, idx2 = self.indices
+        i = self._group_index
+        return (
+            torch.as_tensor([idx1]),
+            torch.as_tensor([idx2]),
+            {key: value[i:i + 1] for key, value in self._group.params.items()}
+        )
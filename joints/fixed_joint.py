@@ -1,86 +1,82 @@
 import torch
-from typing import TYPE_CHECKING
-from vpython import *
+from typing import Iterable, TYPE_CHECKING
 
 from joints import BaseJoint
-from utils import *
 
 if TYPE_CHECKING:
     from simulation import Simulation
     from objects import BaseObject
+    from state import BodyState
 
 class FixedJoint(BaseJoint):
+    num_rows = 6
+
     def __init__(self,
                  simul: 'Simulation',
                  obj1: 'BaseObject',
                  obj2: 'BaseObject',
                  size: float=0.2,
-                 col: color=color.white):
+                 col: Iterable=(1, 1, 1)):
         super().__init__(
             simul=simul,
             obj1=obj1,
-            obj2=obj2
+            obj2=obj2,
+            size=size,
+            col=col
         )
-        mid_pos = (obj1.pos + obj2.pos) / 2
-        self._pos_from_obj1 = mid_pos - obj1.pos
-        self._pos_from_obj2 = mid_pos - obj2.pos
-        self._obj1_init_dir = obj1.dir
-        self._obj2_init_dir = obj2.dir
+        self._init_params()
 
-        self._arm = cylinder(
-            pos=convert_to_vector(obj1.pos),
-            axis=convert_to_vector(obj2.pos - obj1.pos),
-            radius=size,
-            color=col
-        )
+    @classmethod
+    def batch_params(cls,
+                     state: 'BodyState',
+                     idx1: torch.Tensor,
+                     idx2: torch.Tensor,
+                     size: torch.Tensor) -> dict[str, torch.Tensor]:
+        pos1, pos2 = state.pos[idx1], state.pos[idx2]
+        mid_pos = (pos1 + pos2) / 2
+        return {
+            'pos_from_obj1': mid_pos - pos1,
+            'pos_from_obj2': mid_pos - pos2,
+            'obj1_init_dir': state.dir[idx1],
+            'obj2_init_dir': state.dir[idx2]
+        }
 
-    @property
-    def g(self) -> torch.Tensor:
-        g1 = \
-            self._obj1.to_global(self._pos_from_obj1) \
-          - self._obj2.to_global(self._pos_from_obj2)
+    @classmethod
+    def batch_g(cls,
+                state: 'BodyState',
+                idx1: torch.Tensor,
+                idx2: torch.Tensor,
+                params: dict[str, torch.Tensor]) -> torch.Tensor:
+        g1 = cls.anchor_residual(
+            state, idx1, idx2, params['pos_from_obj1'], params['pos_from_obj2']
+        )
 
         g2 = \
-            (self._obj1.dir - self._obj1_init_dir) \
-          - (self._obj2.dir - self._obj2_init_dir)
+            (state.dir[..., idx1, :] - params['obj1_init_dir']) \
+          - (state.dir[..., idx2, :] - params['obj2_init_dir'])
         
-        return torch.hstack([g1, g2])
-
-    @property
-    def G(self) -> torch.Tensor:
-        res = torch.zeros((6, 6 * self._simul.num_objects))
-
-        idx1 = self._obj1.index
-        idx2 = self._obj2.index
-
-        mid_pos = (self._obj1.pos + self._obj2.pos) / 2
-        pos_from_obj1 = mid_pos - self._obj1.pos
-        pos_from_obj2 = mid_pos - self._obj2.pos
+        return torch.cat([g1, g2], dim=-1)
 
+    @classmethod
+    def batch_G_blocks(cls,
+                       state: 'BodyState',
+                       idx1: torch.Tensor,
+                       idx2: torch.Tensor,
+                       params: dict[str, torch.Tensor]
+                       ) -> tuple[torch.Tensor, torch.Tensor]:
         # translation constraints
-        res[0:3, 6 * idx1: 6 * idx1 + 6] = torch.concatenate([
-            self._obj1.lin_vel_coeff_mat,
-            -skew_matrix(pos_from_obj1) @ self._obj1.ang_vel_coeff_mat
-        ], axis=1)
-
-        res[0:3, 6 * idx2: 6 * idx2 + 6] = torch.concatenate([
-            -self._obj2.lin_vel_coeff_mat,
-            skew_matrix(pos_from_obj2) @ self._obj2.ang_vel_coeff_mat
-        ], axis=1)
+        mid_pos = (state.pos[..., idx1, :] + state.pos[..., idx2, :]) / 2
+        trans1, trans2 = cls.translation_blocks(state, idx1, idx2, mid_pos)
 
         # rotation constraints
-        res[3:6, 6 * idx1: 6 * idx1 + 6] = torch.concatenate([
-            torch.zeros((3, 3)),
-            torch.eye(3) if not self._obj1.rot_fixed else torch.zeros((3, 3))
-        ], axis=1)
+        zeros = torch.zeros_like(trans1[..., 0:3])
+        eye = torch.eye(3, dtype=zeros.dtype)
+        eye1 = eye * ~state.rot_fixed[idx1].reshape(-1, 1, 1)
+        eye2 = eye * ~state.rot_fixed[idx2].reshape(-1, 1, 1)
 
-        res[3:6, 6 * idx2: 6 * idx2 + 6] = torch.concatenate([
-            torch.zeros((3, 3)),
-            -torch.eye(3) if not self._obj2.rot_fixed else torch.zeros((3, 3))
-        ], axis=1)
+        rot1 = torch.cat([zeros, eye1.expand_as(zeros)], dim=-1)
+        rot2 = torch.cat([zeros, -eye2.expand_as(zeros)], dim=-1)
 
-        return res
-    
-    def update(self):
-        self._arm.pos = convert_to_vector(self._obj1.pos)
-        self._arm.axis = convert_to_vector(self._obj2.pos - self._obj1.pos)
\ No newline at end of file
+        return \
+            torch.cat([trans1, rot1], dim=-2), \
+            torch.cat([trans2, rot2], dim=-2)
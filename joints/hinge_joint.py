@@ -1,6 +1,5 @@
 import torch
-from typing import Union, Iterable, TYPE_CHECKING
-from vpython import *
+from typing import Iterable, TYPE_CHECKING
 
 from joints import BaseJoint
 from utils import *
@@ -8,114 +7,107 @@ from utils import *
 if TYPE_CHECKING:
     from simulation import Simulation
     from objects import BaseObject
+    from state import BodyState
 
 class HingeJoint(BaseJoint):
+    num_rows = 6
+
     def __init__(self,
                  simul: 'Simulation',
                  obj1: 'BaseObject',
                  obj2: 'BaseObject',
-                 pos: Union[vector, Iterable]=(0, 0, 0),
-                 axis: Union[vector, Iterable]=(1, 0, 0),
+                 pos: Iterable=(0, 0, 0),
+                 axis: Iterable=(1, 0, 0),
                  size: float=0.5,
-                 col: color=color.white):
+                 col: Iterable=(1, 1, 1)):
         super().__init__(
             simul=simul,
             obj1=obj1,
-            obj2=obj2
+            obj2=obj2,
+            size=size,
+            col=col
+        )
+        self._init_params(
+            pos=convert_to_tensor(pos, simul.dtype),
+            axis=convert_to_tensor(axis, simul.dtype)
         )
-        self._pos = convert_to_tensor(pos)
-        self._pos_from_obj1 = self._pos - obj1.pos
-        self._pos_from_obj2 = self._pos - obj2.pos
 
-        self._axis = convert_to_tensor(axis)
-        self._axis *= size / torch.norm(self._axis)
-        self._axis_from_obj1 = obj1.rotate_to_local(self._axis)
-        self._axis_from_obj2 = obj2.rotate_to_local(self._axis)
+    # current world position and axis of the joint
+    @property
+    def pos(self) -> torch.Tensor:
+        return self._obj1.to_global(self.params['pos_from_obj1'])
 
-        self._hinge = cylinder(
-            pos=convert_to_vector(self._pos - self._axis / 2),
-            axis=convert_to_vector(self._axis),
-            radius=size / 10,
-            color=col
-        )
-        self._arm1 = box(
-            pos=convert_to_vector((self._pos + obj1.pos) / 2),
-            axis=convert_to_vector(obj1.pos - self._pos),
-            width=size / 5,
-            height=size,
-            color=obj1.color
-        )
-        self._arm2 = box(
-            pos=convert_to_vector((self._pos + obj2.pos) / 2),
-            axis=convert_to_vector(obj2.pos - self._pos),
-            width=size / 5,
-            height=size,
-            color=obj2.color
+    @property
+    def axis(self) -> torch.Tensor:
+        return self._obj1.rotate_to_global(self.params['axis_from_obj1'])
+
+    @classmethod
+    def batch_params(cls,
+                     state: 'BodyState',
+                     idx1: torch.Tensor,
+                     idx2: torch.Tensor,
+                     size: torch.Tensor,
+                     pos: torch.Tensor,
+                     axis: torch.Tensor) -> dict[str, torch.Tensor]:
+        axis = axis * (size / torch.linalg.norm(axis, dim=-1)).unsqueeze(-1)
+        return {
+            'pos_from_obj1': pos - state.pos[idx1],
+            'pos_from_obj2': pos - state.pos[idx2],
+            'axis_from_obj1': mat_vec(state.rot_mat[idx1].mT, axis),
+            'axis_from_obj2': mat_vec(state.rot_mat[idx2].mT, axis)
+        }
+
+    @classmethod
+    def batch_g(cls,
+                state: 'BodyState',
+                idx1: torch.Tensor,
+                idx2: torch.Tensor,
+                params: dict[str, torch.Tensor]) -> torch.Tensor:
+        g1 = cls.anchor_residual(
+            state, idx1, idx2, params['pos_from_obj1'], params['pos_from_obj2']
         )
 
-    @property
-    def g(self) -> torch.Tensor:
-        g1 = \
-            self._obj1.to_global(self._pos_from_obj1) \
-          - self._obj2.to_global(self._pos_from_obj2)
-        
         g2 = torch.linalg.cross(
-            self._obj1.rotate_to_global(self._axis_from_obj1),
-            self._obj2.rotate_to_global(self._axis_from_obj2)
+            mat_vec(state.rot_mat[..., idx1, :, :], params['axis_from_obj1']),
+            mat_vec(state.rot_mat[..., idx2, :, :], params['axis_from_obj2'])
         )
-        
-        return torch.hstack([g1, g2])
-    
-    @property
-    def G(self) -> torch.Tensor:
-        res = torch.zeros((6, 6 * self._simul.num_objects))
 
-        idx1 = self._obj1.index
-        idx2 = self._obj2.index
+        return torch.cat([g1, g2], dim=-1)
+    
+    @classmethod
+    def batch_G_blocks(cls,
+                       state: 'BodyState',
+                       idx1: torch.Tensor,
+                       idx2: torch.Tensor,
+                       params: dict[str, torch.Tensor]
+                       ) -> tuple[torch.Tensor, torch.Tensor]:
+        rot_mat1 = state.rot_mat[..., idx1, :, :]
+        rot_mat2 = state.rot_mat[..., idx2, :, :]
 
         # translation constraints
-        pos_from_obj1 = self._pos - self._obj1.pos
-        pos_from_obj2 = self._pos - self._obj2.pos
-
-        res[0:3, 6 * idx1: 6 * idx1 + 6] = torch.concatenate([
-            self._obj1.lin_vel_coeff_mat,
-            -skew_matrix(pos_from_obj1) @ self._obj1.ang_vel_coeff_mat
-        ], axis=1)
-
-        res[0:3, 6 * idx2: 6 * idx2 + 6] = torch.concatenate([
-            -self._obj2.lin_vel_coeff_mat,
-            skew_matrix(pos_from_obj2) @ self._obj2.ang_vel_coeff_mat
-        ], axis=1)
+        pos = state.pos[..., idx1, :] \
+            + mat_vec(rot_mat1, params['pos_from_obj1'])
+        trans1, trans2 = cls.translation_blocks(state, idx1, idx2, pos)
 
         # rotation constraints
         obj1_axis_skew = \
-            skew_matrix(self._obj1.rotate_to_global(self._axis_from_obj1))
+            skew_matrix(mat_vec(rot_mat1, params['axis_from_obj1']))
         obj2_axis_skew = \
-            skew_matrix(self._obj2.rotate_to_global(self._axis_from_obj2))
-        
-        res[3:6, 6 * idx1: 6 * idx1 + 6] = torch.concatenate([
-            torch.zeros((3, 3)),
-            obj2_axis_skew @ obj1_axis_skew @ self._obj1.ang_vel_coeff_mat
-        ], axis=1)
-
-        res[3:6, 6 * idx2: 6 * idx2 + 6] = torch.concatenate([
-            torch.zeros((3, 3)),
-            -obj1_axis_skew @ obj2_axis_skew @ self._obj2.ang_vel_coeff_mat
-        ], axis=1)
-
-        return res
-    
-    def update(self):
-        self._pos = self._obj1.to_global(self._pos_from_obj1)
-        self._axis = self._obj1.rotate_to_global(self._axis_from_obj1)
-
-        self._hinge.pos = convert_to_vector(self._pos - self._axis / 2)
-        self._hinge.axis = convert_to_vector(self._axis)
-
-        self._arm1.pos = convert_to_vector((self._pos + self._obj1.pos) / 2)
-        self._arm1.axis = convert_to_vector(self._obj1.pos - self._pos)
-        self._arm1.up = convert_to_vector(self._axis)
-
-        self._arm2.pos = convert_to_vector((self._pos + self._obj2.pos) / 2)
-        self._arm2.axis = convert_to_vector(self._obj2.pos - self._pos)
-        self._arm2.up = convert_to_vector(self._axis)
\ No newline at end of file
+            skew_matrix(mat_vec(rot_mat2, params['axis_from_obj2']))
+        zeros = torch.zeros_like(obj1_axis_skew)
+
+        rot1 = torch.cat([
+            zeros,
+            obj2_axis_skew @ obj1_axis_skew \
+                @ state.ang_vel_coeff_mat[..., idx1, :, :]
+        ], dim=-1)
+
+        rot2 = torch.cat([
+            zeros,
+            -obj1_axis_skew @ obj2_axis_skew \
+                @ state.ang_vel_coeff_mat[..., idx2, :, :]
+        ], dim=-1)
+
+        return \
+            torch.cat([trans1, rot1], dim=-2), \
+            torch.cat([trans2, rot2], dim=-2)
@@ -0,0 +1,137 @@
+import torch
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from joints import BaseJoint
+    from state import BodyState
+
+class JointGroup:
+    def __init__(self,
+                 joints: list['BaseJoint'],
+                 idx1: torch.Tensor,
+                 idx2: torch.Tensor,
+                 params: dict[str, torch.Tensor]):
+        assert len(set(map(type, joints))) == 1, "Mixed joint types"
+        assert len(idx1) == len(idx2) == len(joints)
+
+        self._joint_type = type(joints[0])
+        self._joints = joints
+        # bodies of every joint, as in joint.indices
+        self._idx1 = idx1
+        self._idx2 = idx2
+        # (k x ...) per param, row i belongs to joints[i]
+        self._params = params
+
+    @property
+    def joint_type(self) -> type:
+        return self._joint_type
+
+    @property
+    def joints(self) -> list['BaseJoint']:
+        return self._joints
+
+    @property
+    def num_joints(self) -> int:
+        return len(self._joints)
+
+    @property
+    def num_rows(self) -> int:
+        return self._joint_type.num_rows * len(self._joints)
+
+    @property
+    def idx1(self) -> torch.Tensor:
+        return self._idx1
+
+    @property
+    def idx2(self) -> torch.Tensor:
+        return self._idx2
+
+    @property
+    def params(self) -> dict[str, torch.Tensor]:
+        return self._params
+
+    # (k x rows) residuals and two (k x rows x 6) Jacobian blocks
+    def g(self, state: 'BodyState') -> torch.Tensor:
+        return self._joint_type.batch_g(
+            state, self._idx1, self._idx2, self._params
+        )
+
+    def G_blocks(self,
+                 state: 'BodyState') -> tuple[torch.Tensor, torch.Tensor]:
+        return self._joint_type.batch_G_blocks(
+            state, self._idx1, self._idx2, self._params
+        )
+
+    def pattern(self, row: int) -> tuple[torch.Tensor, torch.Tensor]:
+        # rows and dofs of the entries of G_blocks, concatenated per row,
+        # with the group's rows starting at `row`
+        num_rows = self._joint_type.num_rows
+        block_rows = row + torch.arange(self.num_rows).reshape(-1, 1)
+        block_cols = torch.cat([
+            6 * self._idx1.reshape(-1, 1) + torch.arange(6),
+            6 * self._idx2.reshape(-1, 1) + torch.arange(6)
+        ], dim=1).repeat_interleave(num_rows, dim=0)
+        return block_rows.expand(-1, 12).reshape(-1), block_cols.reshape(-1)
+
+    def select(self, index: torch.Tensor) -> 'JointGroup':
+        # the joints at `index`, with the params of this group
+        return JointGroup(
+            [self._joints[i] for i in index.tolist()],
+            self._idx1[index],
+            self._idx2[index],
+            {key: value[index] for key, value in self._params.items()}
+        )
+
+    def set_dtype(self, dtype: torch.dtype) -> None:
+        self._params = {
+            key: value.to(dtype) for key, value in self._params.items()
+        }
+
+    def bind(self) -> None:
+        # makes every joint read its params from its row of this group
+        for i, joint in enumerate(self._joints):
+            joint.set_group(self, i)
+
+    @staticmethod
+    def group(joints: list['BaseJoint']) -> list['JointGroup']:
+        # one group per joint type. a group the joints of a type were
+        # created in (see BaseJoint.create_many) is used as it is, else
+        # their rows are gathered from the groups they are in
+        by_type: dict[type, list['BaseJoint']] = {}
+        for joint in joints:
+            by_type.setdefault(type(joint), []).append(joint)
+
+        groups = []
+        for type_joints in by_type.values():
+            first = type_joints[0].group
+            if first.joints == type_joints:
+                groups.append(first)
+                continue
+
+            sources = list({
+                id(joint.group): joint.group for joint in type_joints
+            }.values())
+            offsets, start = {}, 0
+            for source in sources:
+                offsets[id(source)] = start
+                start += source.num_joints
+            index = torch.as_tensor([
+                offsets[id(joint.group)] + joint.group_index
+                for joint in type_joints
+            ])
+
+            def gather(tables: list[torch.Tensor]) -> torch.Tensor:
+                return torch.cat(tables)[index]
+
+            group = JointGroup(
+                type_joints,
+                gather([source.idx1 for source in sources]),
+                gather([source.idx2 for source in sources]),
+                {
+                    key: gather([source.params[key] for source in sources])
+                    for key in first.params
+                }
+            )
+            group.bind()
+            groups.append(group)
+        return groups
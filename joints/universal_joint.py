@@ -1,6 +1,5 @@
 import torch
-from typing import Union, Iterable, TYPE_CHECKING
-from vpython import *
+from typing import Iterable, TYPE_CHECKING
 
 from joints import BaseJoint
 from utils import *
@@ -8,154 +7,120 @@ from utils import *
 if TYPE_CHECKING:
     from simulation import Simulation
     from objects import BaseObject
+    from state import BodyState
 
 class UniversalJoint(BaseJoint):
+    num_rows = 4
+
     def __init__(self,
                  simul: 'Simulation',
                  obj1: 'BaseObject',
                  obj2: 'BaseObject',
-                 pos: Union[vector, Iterable]=(0, 0, 0),
-                 axis: Union[vector, Iterable]=(1, 0, 0),
+                 pos: Iterable=(0, 0, 0),
+                 axis: Iterable=(1, 0, 0),
                  size: float=0.8,
-                 col: color=color.white):
+                 col: Iterable=(1, 1, 1)):
         super().__init__(
             simul=simul,
             obj1=obj1,
-            obj2=obj2
+            obj2=obj2,
+            size=size,
+            col=col
+        )
+        self._init_params(
+            pos=convert_to_tensor(pos, simul.dtype),
+            axis=convert_to_tensor(axis, simul.dtype)
         )
-        self._pos = convert_to_tensor(pos)
-        self._pos_from_obj1 = self._pos - obj1.pos
-        self._pos_from_obj2 = self._pos - obj2.pos
 
-        # get universal joint's axises
-        axis = convert_to_tensor(axis)
+    # current world position and axes of the joint
+    @property
+    def pos(self) -> torch.Tensor:
+        return self._obj1.to_global(self.params['pos_from_obj1'])
 
-        temp_axis = torch.linalg.cross(self._pos_from_obj1, axis)
-        self._axis1 = torch.linalg.cross(self._pos_from_obj1, temp_axis)
-        self._axis2 = torch.linalg.cross(self._pos_from_obj2, self._axis1)
-        self._axis1 *= size / torch.norm(self._axis1)
-        self._axis2 *= size / torch.norm(self._axis2)
-        self._axis1_from_obj1 = obj1.rotate_to_local(self._axis1)
-        self._axis2_from_obj2 = obj2.rotate_to_local(self._axis2)
+    @property
+    def axis1(self) -> torch.Tensor:
+        return self._obj1.rotate_to_global(self.params['axis1_from_obj1'])
 
-        axes = torch.cat((self._axis1, self._axis2))
-        assert not torch.any(torch.isnan(axes)), "Axis error"
+    @property
+    def axis2(self) -> torch.Tensor:
+        return self._obj2.rotate_to_global(self.params['axis2_from_obj2'])
+
+    @classmethod
+    def batch_params(cls,
+                     state: 'BodyState',
+                     idx1: torch.Tensor,
+                     idx2: torch.Tensor,
+                     size: torch.Tensor,
+                     pos: torch.Tensor,
+                     axis: torch.Tensor) -> dict[str, torch.Tensor]:
+        pos_from_obj1 = pos - state.pos[idx1]
+        pos_from_obj2 = pos - state.pos[idx2]
 
-        self._cylinder1 = cylinder(
-            pos=convert_to_vector(self._pos - self._axis1 / 2),
-            axis=convert_to_vector(self._axis1),
-            radius = size / 10,
-            color=col
-        )
-        self._cylinder2 = cylinder(
-            pos=convert_to_vector(self._pos - self._axis2 / 2),
-            axis=convert_to_vector(self._axis2),
-            radius = size / 10,
-            color=col
-        )
+        # get universal joint's axises
+        temp_axis = torch.linalg.cross(pos_from_obj1, axis)
+        axis1 = torch.linalg.cross(pos_from_obj1, temp_axis)
+        axis2 = torch.linalg.cross(pos_from_obj2, axis1)
+        axis1 = axis1 * (size / torch.linalg.norm(axis1, dim=-1)).unsqueeze(-1)
+        axis2 = axis2 * (size / torch.linalg.norm(axis2, dim=-1)).unsqueeze(-1)
 
-        width = size / 10
-        height = size / 4
-        self._arm1_1 = box(
-            pos=convert_to_vector((self._pos + obj1.pos + self._axis1) / 2),
-            axis=convert_to_vector(obj1.pos - self._pos),
-            width=width,
-            height=height,
-            color=obj1.color
-        )
-        self._arm1_2 = box(
-            pos=convert_to_vector((self._pos + obj1.pos - self._axis1) / 2),
-            axis=convert_to_vector(obj1.pos - self._pos),
-            width=width,
-            height=height,
-            color=obj1.color
-        )
-        self._arm2_1 = box(
-            pos=convert_to_vector((self._pos + obj2.pos + self._axis2) / 2),
-            axis=convert_to_vector(obj2.pos - self._pos),
-            width=width,
-            height=height,
-            color=obj2.color
-        )
-        self._arm2_2 = box(
-            pos=convert_to_vector((self._pos + obj2.pos - self._axis2) / 2),
-            axis=convert_to_vector(obj2.pos - self._pos),
-            width=width,
-            height=height,
-            color=obj2.color
-        )
+        axes = torch.cat((axis1, axis2), dim=-1)
+        assert not torch.any(torch.isnan(axes)), "Axis error"
 
-    @property
-    def g(self) -> torch.Tensor:
-        g1 = \
-            self._obj1.to_global(self._pos_from_obj1) \
-          - self._obj2.to_global(self._pos_from_obj2)
-        
-        g2 = torch.dot(
-            self._obj1.rotate_to_global(self._axis1_from_obj1),
-            self._obj2.rotate_to_global(self._axis2_from_obj2)
+        return {
+            'pos_from_obj1': pos_from_obj1,
+            'pos_from_obj2': pos_from_obj2,
+            'axis1_from_obj1': mat_vec(state.rot_mat[idx1].mT, axis1),
+            'axis2_from_obj2': mat_vec(state.rot_mat[idx2].mT, axis2)
+        }
+
+    @classmethod
+    def batch_g(cls,
+                state: 'BodyState',
+                idx1: torch.Tensor,
+                idx2: torch.Tensor,
+                params: dict[str, torch.Tensor]) -> torch.Tensor:
+        g1 = cls.anchor_residual(
+            state, idx1, idx2, params['pos_from_obj1'], params['pos_from_obj2']
         )
-        
-        return torch.hstack([g1, g2])
 
-    @property
-    def G(self) -> torch.Tensor:
-        res = torch.zeros((4, 6 * self._simul.num_objects))
+        g2 = torch.sum(
+            mat_vec(state.rot_mat[..., idx1, :, :], params['axis1_from_obj1'])
+          * mat_vec(state.rot_mat[..., idx2, :, :], params['axis2_from_obj2']),
+            dim=-1, keepdim=True
+        )
 
-        idx1 = self._obj1.index
-        idx2 = self._obj2.index
+        return torch.cat([g1, g2], dim=-1)
 
-        pos_from_obj1 = self._pos - self._obj1.pos
-        pos_from_obj2 = self._pos - self._obj2.pos
+    @classmethod
+    def batch_G_blocks(cls,
+                       state: 'BodyState',
+                       idx1: torch.Tensor,
+                       idx2: torch.Tensor,
+                       params: dict[str, torch.Tensor]
+                       ) -> tuple[torch.Tensor, torch.Tensor]:
+        rot_mat1 = state.rot_mat[..., idx1, :, :]
+        rot_mat2 = state.rot_mat[..., idx2, :, :]
 
         # translation constraints
-        res[0:3, 6 * idx1: 6 * idx1 + 6] = torch.concatenate([
-            self._obj1.lin_vel_coeff_mat,
-            -skew_matrix(pos_from_obj1) @ self._obj1.ang_vel_coeff_mat
-        ], axis=1)
-
-        res[0:3, 6 * idx2: 6 * idx2 + 6] = torch.concatenate([
-            -self._obj2.lin_vel_coeff_mat,
-            skew_matrix(pos_from_obj2) @ self._obj2.ang_vel_coeff_mat
-        ], axis=1)
+        pos = state.pos[..., idx1, :] \
+            + mat_vec(rot_mat1, params['pos_from_obj1'])
+        trans1, trans2 = cls.translation_blocks(state, idx1, idx2, pos)
 
         # rotation constraints
-        axis1 = self._obj1.rotate_to_global(self._axis1_from_obj1)
-        axis2 = self._obj2.rotate_to_global(self._axis2_from_obj2)
-
-        res[3, 6 * idx1: 6 * idx1 + 6] = torch.concatenate([
-            torch.zeros((3,)),
-            -axis2 @ skew_matrix(axis1)
-        ])
-
-        res[3, 6 * idx2: 6 * idx2 + 6] = torch.concatenate([
-            torch.zeros((3,)),
-            -axis1 @ skew_matrix(axis2)
-        ])
-
-        return res
-    
-    def update(self):
-        self._pos = self._obj1.to_global(self._pos_from_obj1)
-        self._axis1 = self._obj1.rotate_to_global(self._axis1_from_obj1)
-        self._axis2 = self._obj2.rotate_to_global(self._axis2_from_obj2)
-
-        self._cylinder1.pos = convert_to_vector(self._pos - self._axis1 / 2)
-        self._cylinder2.pos = convert_to_vector(self._pos - self._axis2 / 2)
-        self._cylinder1.axis = convert_to_vector(self._axis1)
-        self._cylinder2.axis = convert_to_vector(self._axis2)
-
-        self._arm1_1.pos = \
-            convert_to_vector((self._pos + self._obj1.pos + self._axis1) / 2)
-        self._arm1_2.pos = \
-            convert_to_vector((self._pos + self._obj1.pos - self._axis1) / 2)
-        self._arm2_1.pos = \
-            convert_to_vector((self._pos + self._obj2.pos + self._axis2) / 2)
-        self._arm2_2.pos = \
-            convert_to_vector((self._pos + self._obj2.pos - self._axis2) / 2)
-        
-        self._arm1_1.axis = convert_to_vector(self._obj1.pos - self._pos)
-        self._arm1_2.axis = convert_to_vector(self._obj1.pos - self._pos)
-        self._arm2_1.axis = convert_to_vector(self._obj2.pos - self._pos)
-        self._arm2_2.axis = convert_to_vector(self._obj2.pos - self._pos)
-    
\ No newline at end of file
+        axis1 = mat_vec(rot_mat1, params['axis1_from_obj1']).unsqueeze(-2)
+        axis2 = mat_vec(rot_mat2, params['axis2_from_obj2']).unsqueeze(-2)
+        zeros = torch.zeros_like(axis1)
+
+        rot1 = torch.cat([
+            zeros,
+            -axis2 @ skew_matrix(axis1.squeeze(-2))
+        ], dim=-1)
+
+        rot2 = torch.cat([
+            zeros,
+            -axis1 @ skew_matrix(axis2.squeeze(-2))
+        ], dim=-1)
+
+        return \
+            torch.cat([trans1, rot1], dim=-2), \
+            torch.cat([trans2, rot2], dim=-2)
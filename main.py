@@ -1,16 +1,19 @@
+import sys
 import torch
 from vpython import *
 
 from simulation import Simulation
 from objects import *
 from joints import *
+from render import Renderer
+from scene import load, read
 
 torch.set_printoptions(threshold=10000000, linewidth=10000000)
 torch.set_default_device('cpu')
-torch.set_default_dtype(torch.float64)
 
 scene = canvas(width=800, height=800)
 simul = Simulation(fps=60, pause=True)
+simul.add_observer(Renderer())
 
 def key_input(ev):
     s = ev.key
@@ -21,6 +24,12 @@ def key_input(ev):
         
 scene.bind('keydown', key_input)
 
+# `python main.py scene.json` shows a scene file instead of the config below
+if len(sys.argv) > 1:
+    load(simul, read(sys.argv[1]))
+    simul.run()
+    sys.exit()
+
 ########################## Make your own configs here ##########################
 box1 = Box(simul, pos=(0, 0, 0), col=color.blue, pos_fixed=True)
 box2 = Box(simul, pos=(0, 2, 2), col=color.green)
@@ -1,6 +1,5 @@
 import torch
-from typing import Union, Iterable, TYPE_CHECKING
-from vpython import *
+from typing import Iterable, Optional, TYPE_CHECKING
 
 from utils import *
 
@@ -10,64 +9,104 @@ if TYPE_CHECKING:
 class BaseObject:
     def __init__(self,
                  simul: 'Simulation',
-                 pos: Union[vector, Iterable]=(0, 0, 0),
-                 dir: Union[vector, Iterable]=(0, 0, 0),
+                 pos: Iterable=(0, 0, 0),
+                 dir: Iterable=(0, 0, 0),
                  mass: float=1,
-                 col: color=color.white,
+                 col: Iterable=(1, 1, 1),
                  pos_fixed: bool=False,
                  rot_fixed: bool=False):
         self._simul = simul
-
-        self._pos = convert_to_tensor(pos)
-        self._pos_before = self._pos.clone()
-        self._dir = convert_to_tensor(dir)
-        self._dir_before = self._dir.clone()
+        self._state = simul.state
         
         self._mass = mass
-        self._color = col
-        self._pos_fixed = pos_fixed
-        self._rot_fixed = rot_fixed
-        self._index = simul.add_object(self)
-        self._obj: standardAttributes = None
-        self._force = torch.zeros((6,))
-    
-    # Spatial properties
+        self._color = convert_to_tensor(col).tolist()
+        self._index = simul.add_object(
+            self,
+            convert_to_tensor(pos, simul.dtype),
+            convert_to_tensor(dir, simul.dtype),
+            pos_fixed,
+            rot_fixed,
+            mass
+        )
+    
+    @classmethod
+    def create_many(cls,
+                    simul: 'Simulation',
+                    pos: Iterable,
+                    dir: Optional[Iterable]=None,
+                    mass: Optional[Iterable]=None,
+                    col: Optional[Iterable]=None,
+                    pos_fixed: Optional[Iterable]=None,
+                    rot_fixed: Optional[Iterable]=None) -> list['BaseObject']:
+        # k objects from (k x ...) columns, the defaults of __init__ for
+        # columns left out. the columns go into the state at once, the
+        # objects only keep plain values, no tensor is made per object
+        pos = torch.as_tensor(pos, dtype=simul.dtype).reshape(-1, 3)
+        k = len(pos)
+        dir = torch.zeros_like(pos) if dir is None \
+            else torch.as_tensor(dir, dtype=simul.dtype)
+        mass = torch.ones((k,), dtype=torch.float64) if mass is None \
+            else torch.as_tensor(mass, dtype=torch.float64).expand(k)
+        col = torch.ones((k, 3), dtype=torch.float64) if col is None \
+            else torch.as_tensor(col, dtype=torch.float64).expand(k, 3)
+        pos_fixed = torch.zeros((k,), dtype=torch.bool) if pos_fixed is None \
+            else torch.as_tensor(pos_fixed, dtype=torch.bool)
+        rot_fixed = torch.zeros((k,), dtype=torch.bool) if rot_fixed is None \
+            else torch.as_tensor(rot_fixed, dtype=torch.bool)
+
+        with gc_paused():
+            objects = [cls.__new__(cls) for _ in range(k)]
+            start = simul.add_objects(
+                objects, pos, dir, pos_fixed, rot_fixed, mass
+            )
+            state = simul.state
+            for index, obj, obj_mass, obj_col in zip(
+                    range(start, start + k), objects,
+                    mass.tolist(), col.tolist()):
+                obj._simul = simul
+                obj._state = state
+                obj._mass = obj_mass
+                obj._color = obj_col
+                obj._index = index
+        return objects
+
+    # Spatial properties, copies of the simulation's body state. they are
+    # changed through the setters, which keep the kinematics cache valid
     @property
     def pos(self) -> torch.Tensor:
-        return self._pos
+        return self._state.pos[self._index].clone()
 
     @property
     def dir(self) -> torch.Tensor:
-        return self._dir
+        return self._state.dir[self._index].clone()
     
     @property
     def lin_vel(self) -> torch.Tensor:
-        return (self._pos - self._pos_before) / self._simul.h
+        return (self.pos - self._state.pos_before[self._index]) / self._simul.h
     
     @property
     def ang_vel(self) -> torch.Tensor:
-        return (self._dir - self._dir_before) / self._simul.h
+        return (self.dir - self._state.dir_before[self._index]) / self._simul.h
     
     @property
     def pos_fixed(self) -> bool:
-        return self._pos_fixed
+        return bool(self._state.pos_fixed[self._index])
 
     @property
     def rot_fixed(self) -> bool:
-        return self._rot_fixed
+        return bool(self._state.rot_fixed[self._index])
     
     @pos.setter
-    def pos(self, value: Union[vector, Iterable]) -> None:
-        self._pos_before = self._pos.clone()
-        self._pos = convert_to_tensor(value)
-        self._obj.pos = convert_to_vector(self._pos)
+    def pos(self, value: Iterable) -> None:
+        self._state.set_pos(
+            self._index, convert_to_tensor(value, self._simul.dtype)
+        )
     
     @dir.setter
-    def dir(self, value: Union[vector, Iterable]) -> None:
-        self._dir_before = self._dir.clone()
-        self._dir = convert_to_tensor(value)
-        self._obj.up = convert_to_vector(self.rot_mat[:, 1])
-        self._obj.axis = convert_to_vector(self.rot_mat[:, 0]) * self._mass
+    def dir(self, value: Iterable) -> None:
+        self._state.set_dir(
+            self._index, convert_to_tensor(value, self._simul.dtype)
+        )
 
     # Object properties
     @property
@@ -75,17 +114,13 @@ class BaseObject:
         return self._mass
     
     @property
-    def color(self) -> color:
-        return self._color
+    def color(self) -> torch.Tensor:
+        return torch.as_tensor(self._color, dtype=torch.float64)
     
     @property
     def index(self) -> int:
         return self._index
 
-    @property
-    def obj(self) -> standardAttributes:
-        return self._obj
-    
     # Dynamic properties
     @property
     def q(self) -> torch.Tensor:
@@ -95,55 +130,27 @@ class BaseObject:
     def v(self) -> torch.Tensor:
         return torch.concatenate([self.lin_vel, self.ang_vel])
     
-    # Matrix porperties
+    # Matrix porperties, copied from the state's batched kinematics cache
     @property
     def lin_vel_coeff_mat(self) -> torch.Tensor:
-        if self._pos_fixed:
-            return torch.zeros((3, 3))
-
-        return torch.eye(3)
+        return self._state.lin_vel_coeff_mat[self._index].clone()
     
     @property
     def ang_vel_coeff_mat(self) -> torch.Tensor:
-        if self._rot_fixed:
-            return torch.zeros((3, 3))
-
-        x, y, z = self._dir
-        return torch.as_tensor([
-            [0, cos(x),  sin(y) * sin(x)],
-            [0, sin(x), -sin(y) * cos(x)],
-            [1,      0,           cos(y)],
-        ])
+        return self._state.ang_vel_coeff_mat[self._index].clone()
     
     @property
     def rot_mat(self) -> torch.Tensor:
-        x, y, z = self._dir
-        return torch.as_tensor([
-            [
-                 cos(z) * cos(x) - cos(y) * sin(x) * sin(z),
-                -sin(z) * cos(x) - cos(y) * sin(x) * cos(z),
-                 sin(y) * sin(x)
-            ],
-            [
-                 cos(z) * sin(x) + cos(y) * cos(x) * sin(z),
-                -sin(z) * sin(x) + cos(y) * cos(x) * cos(z),
-                -sin(y) * cos(x)
-            ],
-            [
-                sin(y) * sin(z),
-                sin(y) * cos(z),
-                cos(y)
-            ],
-        ])
-    
-    # external force
+        return self._state.rot_mat[self._index].clone()
+    
+    # external force, a copy as well
     @property
     def force(self) -> torch.Tensor:
-        return self._force
+        return self._state.force[self._index].clone()
     
     @force.setter
     def force(self, value: torch.Tensor) -> None:
-        self._force = value
+        self._state.force[self._index] = value
 
     # transform functions
     def to_local(self, point: torch.Tensor) -> torch.Tensor:
@@ -156,12 +163,4 @@ class BaseObject:
         return self.rot_mat.T @ point
     
     def rotate_to_global(self, point: torch.Tensor) -> torch.Tensor:
-        return self.rot_mat @ point
-
-    # Update function
-    def update(self, q: torch.Tensor) -> None:
-        _pos = q[0:3]
-        _dir = q[3:6]
-
-        self.pos = convert_to_vector(_pos)
-        self.dir = convert_to_vector(_dir)
\ No newline at end of file
+        return self.rot_mat @ point
\ No newline at end of file
@@ -1,8 +1,6 @@
-from typing import Union, Iterable, TYPE_CHECKING
-from vpython import *
+from typing import Iterable, TYPE_CHECKING
 
 from objects import BaseObject
-from utils import *
 
 if TYPE_CHECKING:
     from simulation import Simulation
@@ -10,10 +8,10 @@ if TYPE_CHECKING:
 class Box(BaseObject):
     def __init__(self,
                  simul: 'Simulation',
-                 pos: Union[vector, Iterable]=(0, 0, 0),
-                 dir: Union[vector, Iterable]=(0, 0, 0),
+                 pos: Iterable=(0, 0, 0),
+                 dir: Iterable=(0, 0, 0),
                  mass: float=1,
-                 col: color=color.white,
+                 col: Iterable=(1, 1, 1),
                  pos_fixed: bool=False,
                  rot_fixed: bool=False):
         super().__init__(
@@ -26,10 +24,7 @@ class Box(BaseObject):
             rot_fixed=rot_fixed
         )
 
-        self._obj = box(
-            pos=convert_to_vector(self._pos),
-            color=col,
-            length=mass,
-            height=mass,
-            width=mass
-        )
+    # edge length of the cube
+    @property
+    def size(self) -> float:
+        return self._mass
\ No newline at end of file
@@ -0,0 +1,26 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+
+class Observer:
+    # True if on_frame already paces the loop to Simulation.fps
+    throttles: bool = False
+
+    # called once from Simulation.init, after the system is built
+    def init(self, simul: 'Simulation') -> None:
+        pass
+
+    # called before the next step when bodies or joints were added after
+    # init, once the system is built again
+    def on_rebuild(self, simul: 'Simulation') -> None:
+        pass
+
+    # called after every physics step
+    def on_step(self, simul: 'Simulation') -> None:
+        pass
+
+    # called once per displayed frame of Simulation.run
+    def on_frame(self, simul: 'Simulation') -> None:
+        pass
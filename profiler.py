@@ -0,0 +1,170 @@
+import csv
+import json
+import sys
+import time
+from collections import deque
+from typing import Optional, TextIO
+
+
+class PhaseTimer:
+    # times consecutive phases of one step or frame: every lap() closes the
+    # phase that started at the previous lap
+    def __init__(self, profiler: 'Profiler', kind: str):
+        self._profiler = profiler
+        self._phases: dict[str, float] = {}
+        self._record = {'kind': kind, 'phases': self._phases}
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        self._phases[name] = self._phases.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def count(self, name: str, value: int=1) -> None:
+        self._record[name] = self._record.get(name, 0) + value
+
+    def end(self, **values) -> None:
+        self._phases['total'] = time.perf_counter() - self._start
+        self._record.update(values)
+        self._profiler.emit(self._record)
+
+class NullTimer:
+    def lap(self, name: str) -> None:
+        pass
+
+    def count(self, name: str, value: int=1) -> None:
+        pass
+
+    def end(self, **values) -> None:
+        pass
+
+class Profiler:
+    def __init__(self, *sinks: 'Sink'):
+        self._sinks = list(sinks)
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    @property
+    def sinks(self) -> list['Sink']:
+        return self._sinks
+
+    def begin(self, kind: str) -> PhaseTimer:
+        return PhaseTimer(self, kind)
+
+    def emit(self, record: dict) -> None:
+        for sink in self._sinks:
+            sink.write(record)
+
+    def close(self) -> None:
+        for sink in self._sinks:
+            sink.close()
+
+class NullProfiler(Profiler):
+    # the default profiler, every call is a no-op
+    _timer = NullTimer()
+
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def enabled(self) -> bool:
+        return False
+
+    def begin(self, kind: str) -> NullTimer:
+        return self._timer
+
+# sinks receive one record per profiled step ('step') or frame ('frame'):
+# its kind, the times of its phases in seconds under 'phases', and counters
+# and solver stats
+class Sink:
+    def write(self, record: dict) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class RingBufferSink(Sink):
+    def __init__(self, size: int=1000):
+        self._records = deque(maxlen=size)
+
+    @property
+    def records(self) -> list[dict]:
+        return list(self._records)
+
+    def write(self, record: dict) -> None:
+        self._records.append(record)
+
+class JsonLinesSink(Sink):
+    def __init__(self, path: str):
+        self._file = open(path, 'w')
+
+    def write(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self) -> None:
+        self._file.close()
+
+class CsvSink(Sink):
+    # one kind of record per file, columns are taken from the first record
+    # with the phase times among them
+    def __init__(self, path: str, kind: str='step'):
+        self._file = open(path, 'w', newline='')
+        self._kind = kind
+        self._writer: Optional[csv.DictWriter] = None
+
+    def write(self, record: dict) -> None:
+        if record['kind'] != self._kind:
+            return
+        row = {key: value for key, value in record.items() if key != 'phases'}
+        row.update(record['phases'])
+        if self._writer is None:
+            self._writer = csv.DictWriter(
+                self._file, fieldnames=list(row), extrasaction='ignore'
+            )
+            self._writer.writeheader()
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        self._file.close()
+
+class ConsoleSummarySink(Sink):
+    # prints per-record means of phase times (ms) and of every other number
+    # every `every` records
+    def __init__(self, every: int=100, kind: str='step', out: TextIO=None):
+        self._every = every
+        self._kind = kind
+        self._out = out if out is not None else sys.stdout
+        self._times: dict[str, float] = {}
+        self._sums: dict[str, float] = {}
+        self._num_records = 0
+
+    def write(self, record: dict) -> None:
+        if record['kind'] != self._kind:
+            return
+        for key, value in record['phases'].items():
+            self._times[key] = self._times.get(key, 0.0) + value
+        for key, value in record.items():
+            if isinstance(value, (int, float)):
+                self._sums[key] = self._sums.get(key, 0) + value
+        self._num_records += 1
+        if self._num_records == self._every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._num_records:
+            return
+        parts = [f"[{self._kind} x{self._num_records}]"]
+        for key, value in self._times.items():
+            parts.append(f"{key} {1e3 * value / self._num_records:.3f}ms")
+        for key, value in self._sums.items():
+            if key != 'step':
+                parts.append(f"{key} {value / self._num_records:.4g}")
+        print(' '.join(parts), file=self._out)
+        self._times = {}
+        self._sums = {}
+        self._num_records = 0
+
+    def close(self) -> None:
+        self.flush()
@@ -0,0 +1,246 @@
+import mmap
+import os
+import struct
+import time
+import torch
+from typing import Iterable, Optional, TYPE_CHECKING
+
+from observer import Observer
+
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+# file layout: a fixed size header followed by one row of float64 per
+# recorded step, [step, q (n x 6), v (n x 6), lambda (m)]
+MAGIC = b'DSIMREC\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIdQ')
+HEADER_SIZE = 64
+ITEM_SIZE = 8
+
+
+def row_size(num_objects: int, num_constraints: int) -> int:
+    return 1 + 12 * num_objects + num_constraints
+
+
+class Recorder(Observer):
+    # appends the state of every `every`-th step to a memory mapped file,
+    # the file grows by doubling so a step only copies into the mapping
+    def __init__(self, path: str, every: int=1, capacity: int=1024):
+        assert every >= 1, "every must be positive"
+        self._path = path
+        self._every = every
+        self._initial_capacity = capacity
+        # the simulation it observes, from init to close
+        self._simul = None
+        self._file = None
+        self._mmap = None
+        self._rows = None
+        self._capacity = 0
+        self._num_frames = 0
+        self._num_objects = 0
+        self._num_constraints = 0
+        self._dt = 0.0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def num_frames(self) -> int:
+        return self._num_frames
+
+    def init(self, simul: 'Simulation') -> None:
+        assert simul.state.pos.dim() == 2, "Batched states are not recorded"
+        self._close_file()
+
+        self._simul = simul
+        self._num_objects = simul.num_objects
+        self._num_constraints = simul.num_constraints
+        self._dt = simul.dt * self._every
+        self._num_frames = 0
+        self._file = open(self._path, 'w+b')
+        self._map(self._initial_capacity)
+        self._write_header()
+
+    def on_rebuild(self, simul: 'Simulation') -> None:
+        # every frame of a recording has the same layout
+        raise RuntimeError("Scene changed while recording")
+
+    def on_step(self, simul: 'Simulation') -> None:
+        if simul.num_steps % self._every:
+            return
+        if self._num_frames == self._capacity:
+            self._map(2 * self._capacity)
+
+        n = self._num_objects
+        row = self._rows[self._num_frames]
+        q = row[1:1 + 6 * n].view(n, 6)
+        v = row[1 + 6 * n:1 + 12 * n].view(n, 6)
+        state = simul.state
+
+        row[0] = simul.num_steps
+        q[:, 0:3] = state.pos
+        q[:, 3:6] = state.dir
+        torch.sub(state.pos, state.pos_before, out=v[:, 0:3])
+        torch.sub(state.dir, state.dir_before, out=v[:, 3:6])
+        v.div_(simul.dt)
+        row[1 + 12 * n:] = simul.lambda_
+
+        self._num_frames += 1
+        self._write_header()
+
+    def close(self) -> None:
+        # trims the file to the recorded frames and stops observing
+        self._close_file()
+        if self._simul is not None and self in self._simul.observers:
+            self._simul.remove_observer(self)
+        self._simul = None
+
+    def _close_file(self) -> None:
+        if self._file is None:
+            return
+        self._rows = None
+        self._mmap.close()
+        self._file.truncate(self._offset(self._num_frames))
+        self._file.close()
+        self._mmap = None
+        self._file = None
+        self._capacity = 0
+
+    def _offset(self, num_frames: int) -> int:
+        return HEADER_SIZE + num_frames * ITEM_SIZE \
+            * row_size(self._num_objects, self._num_constraints)
+
+    def _map(self, capacity: int) -> None:
+        # the tensor view has to go before the mapping can be closed
+        self._rows = None
+        if self._mmap is not None:
+            self._mmap.close()
+
+        size = self._offset(capacity)
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._rows = torch.frombuffer(
+            self._mmap,
+            dtype=torch.float64,
+            offset=HEADER_SIZE
+        ).view(capacity, -1)
+        self._capacity = capacity
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(
+            self._mmap, 0, MAGIC, VERSION, self._num_objects,
+            self._num_constraints, self._dt, self._num_frames
+        )
+
+
+class Replay:
+    # read side of a Recorder file, frames are views into the mapping
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            assert size >= HEADER_SIZE, "Not a recording"
+            self._mmap = mmap.mmap(
+                file.fileno(), size, access=mmap.ACCESS_COPY
+            )
+
+        magic, version, n, m, dt, num_frames = \
+            HEADER.unpack_from(self._mmap, 0)
+        assert magic == MAGIC, "Not a recording"
+        assert version == VERSION, "Unsupported recording version"
+
+        self._num_objects = n
+        self._num_constraints = m
+        self._dt = dt
+        self._num_frames = num_frames
+        self._rows = torch.frombuffer(
+            self._mmap,
+            dtype=torch.float64,
+            offset=HEADER_SIZE,
+            count=num_frames * row_size(n, m)
+        ).view(num_frames, -1)
+
+    @property
+    def num_frames(self) -> int:
+        return self._num_frames
+
+    @property
+    def num_objects(self) -> int:
+        return self._num_objects
+
+    @property
+    def num_constraints(self) -> int:
+        return self._num_constraints
+
+    # time between two frames
+    @property
+    def dt(self) -> float:
+        return self._dt
+
+    @property
+    def steps(self) -> torch.Tensor:
+        return self._rows[:, 0]
+
+    @property
+    def q(self) -> torch.Tensor:
+        n = self._num_objects
+        return self._rows[:, 1:1 + 6 * n].view(-1, n, 6)
+
+    @property
+    def v(self) -> torch.Tensor:
+        n = self._num_objects
+        return self._rows[:, 1 + 6 * n:1 + 12 * n].view(-1, n, 6)
+
+    @property
+    def lambda_(self) -> torch.Tensor:
+        return self._rows[:, 1 + 12 * self._num_objects:]
+
+    def __len__(self) -> int:
+        return self._num_frames
+
+    def close(self) -> None:
+        self._rows = None
+        self._mmap.close()
+
+    def apply(self, simul: 'Simulation', frame: int) -> None:
+        # writes a frame into the state of `simul`, nothing is solved
+        assert simul.num_objects == self._num_objects, "Scene mismatch"
+        q, v = self.q[frame], self.v[frame]
+        state = simul.state
+
+        state.pos.copy_(q[:, 0:3])
+        state.dir.copy_(q[:, 3:6])
+        torch.sub(q[:, 0:3], v[:, 0:3], alpha=simul.dt, out=state.pos_before)
+        torch.sub(q[:, 3:6], v[:, 3:6], alpha=simul.dt, out=state.dir_before)
+        state.touch()
+        if simul.lambda_ is not None:
+            simul.lambda_.copy_(self.lambda_[frame])
+
+    def play(self,
+             simul: 'Simulation',
+             realtime: bool=True,
+             frames: Optional[Iterable[int]]=None) -> None:
+        # drives the observers of `simul` (e.g. render.Renderer) from the
+        # recording, every frame is shown
+        if not simul.initialized:
+            simul.init()
+        throttled = any(observer.throttles for observer in simul.observers)
+        next_frame = time.perf_counter()
+
+        for frame in frames if frames is not None else range(len(self)):
+            if not simul.running:
+                break
+            self.apply(simul, frame)
+            for observer in simul.observers:
+                observer.on_step(simul)
+            for observer in simul.observers:
+                observer.on_frame(simul)
+
+            if realtime and not throttled:
+                next_frame += self._dt
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame = time.perf_counter()
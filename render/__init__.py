@@ -0,0 +1,5 @@
+from .visuals import BaseVisual, BoxVisual, BallJointVisual, \
+    FixedJointVisual, HingeJointVisual, UniversalJointVisual
+from .sync import RenderSync
+
+from .renderer import Renderer
@@ -0,0 +1,78 @@
+from typing import Callable, TYPE_CHECKING
+from vpython import rate
+
+from objects import Box
+from joints import BallJoint, FixedJoint, HingeJoint, UniversalJoint
+from observer import Observer
+from render.sync import RenderSync
+from render.visuals import *
+
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+
+class Renderer(Observer):
+    throttles = True
+
+    # physics class -> visual class, looked up along the MRO
+    visual_types: dict[type, Callable] = {
+        Box: BoxVisual,
+        BallJoint: BallJointVisual,
+        FixedJoint: FixedJointVisual,
+        HingeJoint: HingeJointVisual,
+        UniversalJoint: UniversalJointVisual,
+    }
+
+    # attributes that moved by less than `epsilon` (world units) since
+    # they were last sent are not sent again
+    def __init__(self, max_rate: int=10000, epsilon: float=1e-3):
+        self._visuals: list[BaseVisual] = []
+        # bodies and joints that have a visual
+        self._num_objects = 0
+        self._num_joints = 0
+        self._max_rate = max_rate
+        self._sync = RenderSync(epsilon)
+
+    @property
+    def visuals(self) -> list[BaseVisual]:
+        return self._visuals
+
+    @property
+    def sync(self) -> RenderSync:
+        return self._sync
+
+    def init(self, simul: 'Simulation') -> None:
+        self._sync = RenderSync(self._sync.epsilon)
+        self._visuals = [
+            self.make_visual(target)
+            for target in simul.objects + simul.joints
+        ]
+        self._num_objects = simul.num_objects
+        self._num_joints = simul.num_joints
+        self._sync.flush()
+
+    def on_rebuild(self, simul: 'Simulation') -> None:
+        # visuals for the bodies and joints added since
+        self._visuals += [
+            self.make_visual(target)
+            for target in simul.objects[self._num_objects:]
+            + simul.joints[self._num_joints:]
+        ]
+        self._num_objects = simul.num_objects
+        self._num_joints = simul.num_joints
+        self._sync.flush()
+
+    def on_frame(self, simul: 'Simulation') -> None:
+        # every visual writes into the sync, the changes go out at once
+        for visual in self._visuals:
+            visual.update()
+        self._sync.flush()
+
+        # rate() also services the browser, so it runs even when unthrottled
+        rate(simul.fps if simul.realtime else self._max_rate)
+
+    def make_visual(self, target: object) -> BaseVisual:
+        for cls in type(target).__mro__:
+            if cls in self.visual_types:
+                return self.visual_types[cls](target, self._sync)
+        return BaseVisual()
@@ -0,0 +1,72 @@
+import torch
+from vpython import vector
+
+
+class RenderSync:
+    # the vector attributes of every visual, pushed to vpython once per
+    # frame. visuals write their values into slots, flush() sends only the
+    # slots that moved by more than `epsilon` since they were last sent, so
+    # slow drifts still show up once they add up to epsilon
+    def __init__(self, epsilon: float=1e-3):
+        self._epsilon = epsilon
+        self._slots: list[tuple[object, str]] = []
+        self._values = torch.zeros((0, 3), dtype=torch.float64)
+        self._shown = torch.zeros((0, 3), dtype=torch.float64)
+        self._num_shown = 0
+        self._num_pushed = 0
+
+    @property
+    def epsilon(self) -> float:
+        return self._epsilon
+
+    @property
+    def num_slots(self) -> int:
+        return len(self._slots)
+
+    # slots sent by the last flush
+    @property
+    def num_pushed(self) -> int:
+        return self._num_pushed
+
+    @epsilon.setter
+    def epsilon(self, value: float) -> None:
+        self._epsilon = value
+
+    def add(self, attributes: list[tuple[object, str]]) -> int:
+        # registers (target, attribute) pairs as consecutive slots, returns
+        # the first one
+        start = len(self._slots)
+        self._slots += attributes
+        return start
+
+    def set(self, start: int, values: torch.Tensor) -> None:
+        # (k x 3) values of the k slots from `start`
+        if len(self._values) < len(self._slots):
+            self._reserve()
+        self._values[start:start + len(values)] = values
+
+    def flush(self) -> None:
+        if len(self._values) < len(self._slots):
+            self._reserve()
+
+        # new slots are always sent
+        changed = (self._values - self._shown).abs().amax(dim=1) \
+            > self._epsilon
+        changed[self._num_shown:] = True
+        index = changed.nonzero().squeeze(1)
+        self._shown[index] = self._values[index]
+        self._num_shown = len(self._slots)
+        self._num_pushed = len(index)
+
+        for i, value in zip(index.tolist(), self._values[index].tolist()):
+            target, attribute = self._slots[i]
+            setattr(target, attribute, vector(*value))
+
+    def _reserve(self) -> None:
+        def grow(buffer: torch.Tensor) -> torch.Tensor:
+            res = buffer.new_zeros((len(self._slots), 3))
+            res[:len(buffer)] = buffer
+            return res
+
+        self._values = grow(self._values)
+        self._shown = grow(self._shown)
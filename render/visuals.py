@@ -0,0 +1,183 @@
+import torch
+from typing import TYPE_CHECKING
+from vpython import box, cylinder, sphere, vector
+
+from utils import convert_to_vector
+
+if TYPE_CHECKING:
+    from objects import Box
+    from joints import BallJoint, FixedJoint, HingeJoint, UniversalJoint
+    from render.sync import RenderSync
+
+class BaseVisual:
+    # visuals register their vector attributes with a RenderSync and write
+    # the new values there, the renderer sends them once per frame
+    def update(self) -> None:
+        pass
+
+    def _bind(self,
+              sync: 'RenderSync',
+              attributes: list[tuple[object, str]]) -> None:
+        self._sync = sync
+        self._start = sync.add(attributes)
+
+    def _write(self, *values: torch.Tensor) -> None:
+        # in the order of the attributes given to _bind
+        self._sync.set(self._start, torch.stack(values))
+
+class BoxVisual(BaseVisual):
+    def __init__(self, target: 'Box', sync: 'RenderSync'):
+        self._target = target
+        self._box = box(
+            pos=convert_to_vector(target.pos),
+            color=convert_to_vector(target.color),
+            length=target.size,
+            height=target.size,
+            width=target.size
+        )
+        self._bind(sync, [
+            (self._box, 'pos'), (self._box, 'up'), (self._box, 'axis')
+        ])
+        self.update()
+
+    def update(self) -> None:
+        rot_mat = self._target.rot_mat
+        self._write(
+            self._target.pos,
+            rot_mat[:, 1],
+            rot_mat[:, 0] * self._target.size
+        )
+
+class BallJointVisual(BaseVisual):
+    def __init__(self, target: 'BallJoint', sync: 'RenderSync'):
+        self._target = target
+        size = target.size
+
+        self._ball = sphere(
+            color=convert_to_vector(target.color),
+            size=vector(size, size, size) * 2
+        )
+        self._arm1 = cylinder(
+            radius=size,
+            color=convert_to_vector(target.obj1.color)
+        )
+        self._arm2 = cylinder(
+            radius=size,
+            color=convert_to_vector(target.obj2.color)
+        )
+        self._bind(sync, [
+            (self._ball, 'pos'),
+            (self._arm1, 'pos'), (self._arm1, 'axis'),
+            (self._arm2, 'pos'), (self._arm2, 'axis')
+        ])
+        self.update()
+
+    def update(self) -> None:
+        pos = self._target.pos
+        self._write(
+            pos,
+            pos, self._target.obj1.pos - pos,
+            pos, self._target.obj2.pos - pos
+        )
+
+class FixedJointVisual(BaseVisual):
+    def __init__(self, target: 'FixedJoint', sync: 'RenderSync'):
+        self._target = target
+
+        self._arm = cylinder(
+            radius=target.size,
+            color=convert_to_vector(target.color)
+        )
+        self._bind(sync, [(self._arm, 'pos'), (self._arm, 'axis')])
+        self.update()
+
+    def update(self) -> None:
+        pos1 = self._target.obj1.pos
+        pos2 = self._target.obj2.pos
+        self._write(pos1, pos2 - pos1)
+
+class HingeJointVisual(BaseVisual):
+    def __init__(self, target: 'HingeJoint', sync: 'RenderSync'):
+        self._target = target
+        size = target.size
+
+        self._hinge = cylinder(
+            radius=size / 10,
+            color=convert_to_vector(target.color)
+        )
+        self._arm1 = box(
+            width=size / 5,
+            height=size,
+            color=convert_to_vector(target.obj1.color)
+        )
+        self._arm2 = box(
+            width=size / 5,
+            height=size,
+            color=convert_to_vector(target.obj2.color)
+        )
+        self._bind(sync, [
+            (self._hinge, 'pos'), (self._hinge, 'axis'),
+            (self._arm1, 'pos'), (self._arm1, 'axis'), (self._arm1, 'up'),
+            (self._arm2, 'pos'), (self._arm2, 'axis'), (self._arm2, 'up')
+        ])
+        self.update()
+
+    def update(self) -> None:
+        pos = self._target.pos
+        axis = self._target.axis
+        pos1 = self._target.obj1.pos
+        pos2 = self._target.obj2.pos
+
+        self._write(
+            pos - axis / 2, axis,
+            (pos + pos1) / 2, pos1 - pos, axis,
+            (pos + pos2) / 2, pos2 - pos, axis
+        )
+
+class UniversalJointVisual(BaseVisual):
+    def __init__(self, target: 'UniversalJoint', sync: 'RenderSync'):
+        self._target = target
+        size = target.size
+
+        self._cylinder1 = cylinder(
+            radius=size / 10,
+            color=convert_to_vector(target.color)
+        )
+        self._cylinder2 = cylinder(
+            radius=size / 10,
+            color=convert_to_vector(target.color)
+        )
+
+        width = size / 10
+        height = size / 4
+        color1 = convert_to_vector(target.obj1.color)
+        color2 = convert_to_vector(target.obj2.color)
+        self._arm1_1 = box(width=width, height=height, color=color1)
+        self._arm1_2 = box(width=width, height=height, color=color1)
+        self._arm2_1 = box(width=width, height=height, color=color2)
+        self._arm2_2 = box(width=width, height=height, color=color2)
+        self._bind(sync, [
+            (self._cylinder1, 'pos'), (self._cylinder2, 'pos'),
+            (self._cylinder1, 'axis'), (self._cylinder2, 'axis'),
+            (self._arm1_1, 'pos'), (self._arm1_2, 'pos'),
+            (self._arm2_1, 'pos'), (self._arm2_2, 'pos'),
+            (self._arm1_1, 'axis'), (self._arm1_2, 'axis'),
+            (self._arm2_1, 'axis'), (self._arm2_2, 'axis')
+        ])
+        self.update()
+
+    def update(self) -> None:
+        pos = self._target.pos
+        axis1 = self._target.axis1
+        axis2 = self._target.axis2
+        pos1 = self._target.obj1.pos
+        pos2 = self._target.obj2.pos
+
+        self._write(
+            pos - axis1 / 2, pos - axis2 / 2,
+            axis1, axis2,
+            (pos + pos1 + axis1) / 2, (pos + pos1 - axis1) / 2,
+            (pos + pos2 + axis2) / 2, (pos + pos2 - axis2) / 2,
+            pos1 - pos, pos1 - pos,
+            pos2 - pos, pos2 - pos
+        )
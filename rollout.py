@@ -0,0 +1,205 @@
+import torch
+from torch.utils.checkpoint import checkpoint
+from typing import Optional, TYPE_CHECKING
+
+from state import StateView
+from utils import dof_gravity, tikhonov_shift
+
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+
+class Rollout:
+    # differentiable trajectories of the scene of a Simulation. a step is a
+    # pure function of the state, the masses and the joint params, solved
+    # through a dense Schur complement, so the gradient of a loss on the
+    # trajectory flows back to all of them in one backward pass. meant for
+    # parameter identification on small scenes, the simulation itself is
+    # only read. with checkpoint_every, only every checkpoint_every-th state
+    # is kept for the backward pass and the steps in between are recomputed
+    def __init__(self,
+                 simul: 'Simulation',
+                 checkpoint_every: Optional[int]=None):
+        assert checkpoint_every is None or checkpoint_every >= 1, \
+            "checkpoint_every must be positive"
+        if not simul.initialized:
+            simul.init()
+        assert simul.state.pos.dim() == 2, "Batched states are not rolled out"
+        assert not simul.asleep.any(), "Sleeping bodies are not rolled out"
+
+        self._simul = simul
+        self._checkpoint_every = checkpoint_every
+        self._groups = simul.joint_groups
+        self._free_dofs = simul.free_dofs
+        self._lambda_rows = simul.lambda_rows
+
+        # entries of G over all joints, rows in the global layout of
+        # Simulation.lambda_, reduced to its active rows and free dofs
+        rows, cols = [], []
+        for group, group_row in zip(self._groups, simul.group_rows):
+            group_rows, group_cols = group.pattern(group_row)
+            rows.append(group_rows)
+            cols.append(group_cols)
+        rows = torch.cat(rows) if rows else torch.zeros((0,), dtype=int)
+        cols = torch.cat(cols) if cols else torch.zeros((0,), dtype=int)
+
+        row_map = torch.full((simul.num_constraints,), -1)
+        row_map[self._lambda_rows] = torch.arange(len(self._lambda_rows))
+        dof_map = torch.full((6 * simul.num_objects,), -1)
+        dof_map[self._free_dofs] = torch.arange(len(self._free_dofs))
+        keep = (row_map[rows] >= 0) & (dof_map[cols] >= 0)
+        self._entries = keep.nonzero().squeeze(1)
+        self._rows = row_map[rows[keep]]
+        self._cols = dof_map[cols[keep]]
+
+        # E couples the rows of an island only, as in Simulation
+        row_island = simul.row_island
+        same_island = row_island.reshape(-1, 1) == row_island.reshape(1, -1)
+        self._E = same_island.to(simul.dtype) * simul.epsilon
+        # per unit mass
+        self._gravity = dof_gravity(
+            torch.ones((6 * simul.num_objects,), dtype=simul.dtype)
+        )
+
+    @property
+    def simulation(self) -> 'Simulation':
+        return self._simul
+
+    @property
+    def checkpoint_every(self) -> Optional[int]:
+        return self._checkpoint_every
+
+    def parameters(self) -> dict[str, torch.Tensor]:
+        # copies of the current values, to be set to requires_grad and
+        # passed to run(). joint params are keyed '<joint type>.<param>',
+        # e.g. 'HingeJoint.pos_from_obj1' (k x 3) for the anchors
+        state = self._simul.state
+        params = {
+            'mass': state.mass.to(self._simul.dtype, copy=True),
+            'pos': state.pos.clone(),
+            'dir': state.dir.clone(),
+        }
+        for group in self._groups:
+            for key, value in group.params.items():
+                params[f'{group.joint_type.__name__}.{key}'] = value.clone()
+        return params
+
+    def run(self,
+            steps: int,
+            params: Optional[dict[str, torch.Tensor]]=None) -> torch.Tensor:
+        # q (steps x n x 6) after every step, starting from the current
+        # velocities with `params` in place of the values they name
+        assert steps >= 1, "steps must be positive"
+        values = self.parameters()
+        if params is not None:
+            assert set(params) <= set(values), "Unknown parameter"
+            values.update(params)
+
+        state = self._simul.state
+        pos, dir = values['pos'], values['dir']
+        x = (
+            pos, pos - (state.pos - state.pos_before),
+            dir, dir - (state.dir - state.dir_before)
+        )
+        args = (values['mass'], state.force.clone()) + tuple(
+            values[f'{group.joint_type.__name__}.{key}']
+            for group in self._groups
+            for key in group.params
+        )
+
+        every = self._checkpoint_every or steps
+        q = []
+        for start in range(0, steps, every):
+            num_steps = min(every, steps - start)
+            if self._checkpoint_every is None:
+                *x, segment = self._segment(num_steps, *x, *args)
+            else:
+                *x, segment = checkpoint(
+                    self._segment, num_steps, *x, *args, use_reentrant=False
+                )
+            q.append(segment)
+        return torch.cat(q)
+
+    def _segment(self,
+                 num_steps: int,
+                 pos: torch.Tensor,
+                 pos_before: torch.Tensor,
+                 dir: torch.Tensor,
+                 dir_before: torch.Tensor,
+                 mass: torch.Tensor,
+                 force: torch.Tensor,
+                 *flat_params: torch.Tensor) -> tuple[torch.Tensor, ...]:
+        # num_steps steps, returns the last state and q of every step
+        params, i = [], 0
+        for group in self._groups:
+            params.append(dict(zip(group.params, flat_params[i:])))
+            i += len(group.params)
+
+        dof_mass = mass.repeat_interleave(6)
+        M = dof_mass[self._free_dofs].reshape(-1, 1)
+        V_q = (dof_mass * self._gravity)[self._free_dofs].reshape(-1, 1)
+        f = force.reshape(-1)[self._free_dofs].reshape(-1, 1)
+
+        q = []
+        for _ in range(num_steps):
+            pos, pos_before, dir, dir_before = self._step(
+                pos, pos_before, dir, dir_before, M, V_q, f, params
+            )
+            q.append(torch.cat([pos, dir], dim=1))
+        return pos, pos_before, dir, dir_before, torch.stack(q)
+
+    def _step(self,
+              pos: torch.Tensor,
+              pos_before: torch.Tensor,
+              dir: torch.Tensor,
+              dir_before: torch.Tensor,
+              M: torch.Tensor,
+              V_q: torch.Tensor,
+              f: torch.Tensor,
+              params: list[dict[str, torch.Tensor]]
+              ) -> tuple[torch.Tensor, ...]:
+        # the step of Simulation.update without any in place write
+        simul = self._simul
+        h, Lambda = simul.h, simul.Lambda
+        state = StateView(pos, dir, simul.state.pos_fixed,
+                          simul.state.rot_fixed)
+        v = torch.cat([pos - pos_before, dir - dir_before], dim=1) / h
+        v = v.reshape(-1)[self._free_dofs].reshape(-1, 1)
+
+        if self._groups:
+            g = torch.cat([
+                group.joint_type.batch_g(
+                    state, group.idx1, group.idx2, group_params
+                ).reshape(-1)
+                for group, group_params in zip(self._groups, params)
+            ])[self._lambda_rows].reshape(-1, 1)
+            values = torch.cat([
+                torch.cat(group.joint_type.batch_G_blocks(
+                    state, group.idx1, group.idx2, group_params
+                ), dim=-1).reshape(-1)
+                for group, group_params in zip(self._groups, params)
+            ])[self._entries]
+        else:
+            g = v.new_zeros((0, 1))
+            values = v.new_zeros((0,))
+        G = v.new_zeros((len(g), len(v))).index_put(
+            (self._rows, self._cols), values
+        )
+
+        B1 = M * v - h * V_q + h * f
+        B2 = -4 * Lambda / h * g + Lambda * G @ v
+
+        # (G M^-1 G^T + E) lambda = B2 - G M^-1 B1. redundant rows get a
+        # Tikhonov term at the rounding level, as in TreeSolver, so the
+        # Cholesky factor and its gradient always exist
+        G_scaled = G / M.reshape(1, -1)
+        S = G_scaled @ G.T + self._E
+        delta = tikhonov_shift(S.diagonal().detach())
+        L = torch.linalg.cholesky(S + torch.diag(delta))
+        lam = torch.cholesky_solve(B2 - G_scaled @ B1, L)
+        v_free = (B1 + G.T @ lam) / M
+
+        v_next = v.new_zeros((6 * simul.num_objects,)).index_put(
+            (self._free_dofs,), v_free.reshape(-1)
+        ).reshape(-1, 6)
+        return pos + h * v_next[:, 0:3], pos, dir + h * v_next[:, 3:6], dir
@@ -0,0 +1,140 @@
+import json
+import math
+import torch
+from typing import Any
+
+from joints import BaseJoint, BallJoint, FixedJoint, HingeJoint, \
+    UniversalJoint
+from objects import Box
+from simulation import Simulation
+
+# a scene is a dict of columns with one row per body or joint, as nested
+# lists (JSON) or tensors. every column but pos and bodies is optional and
+# defaults to the constructor's default:
+# {
+#     'simulation': {'fps': 60, ...},     keyword arguments of Simulation
+#     'bodies': {
+#         'pos': (n x 3), 'dir': (n x 3), 'mass': (n), 'color': (n x 3),
+#         'pos_fixed': (n), 'rot_fixed': (n)
+#     },
+#     'joints': [                         one table per joint type
+#         {
+#             'type': 'hinge', 'bodies': (k x 2), 'pos': (k x 3),
+#             'axis': (k x 3), 'size': (k), 'color': (k x 3)
+#         }
+#     ]
+# }
+# joint tables index the bodies of the scene, from 0
+JOINT_TYPES: dict[str, type[BaseJoint]] = {
+    'ball': BallJoint,
+    'hinge': HingeJoint,
+    'universal': UniversalJoint,
+    'fixed': FixedJoint,
+}
+
+SPACING = 2.0
+
+
+def load(simul: Simulation,
+         scene: dict) -> tuple[list[Box], list[BaseJoint]]:
+    # adds the bodies and joints of `scene` to `simul` in bulk
+    bodies = scene['bodies']
+    objects = Box.create_many(
+        simul,
+        bodies['pos'],
+        dir=bodies.get('dir'),
+        mass=bodies.get('mass'),
+        col=bodies.get('color'),
+        pos_fixed=bodies.get('pos_fixed'),
+        rot_fixed=bodies.get('rot_fixed')
+    )
+    start = simul.num_objects - len(objects)
+
+    joints = []
+    for table in scene.get('joints', []):
+        pairs = torch.as_tensor(table['bodies']).reshape(-1, 2) + start
+        columns = {
+            key: value for key, value in table.items()
+            if key not in ('type', 'bodies', 'color')
+        }
+        joints += JOINT_TYPES[table['type']].create_many(
+            simul, pairs[:, 0], pairs[:, 1], col=table.get('color'),
+            **columns
+        )
+    return objects, joints
+
+def build(scene: dict) -> Simulation:
+    # a new, not yet initialized simulation of `scene`
+    simul = Simulation(**scene.get('simulation', {'fps': 60}))
+    load(simul, scene)
+    return simul
+
+def read(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+def write(path: str, scene: dict) -> None:
+    def plain(value: Any) -> Any:
+        if isinstance(value, torch.Tensor):
+            return value.tolist()
+        if isinstance(value, dict):
+            return {key: plain(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [plain(item) for item in value]
+        return value
+
+    with open(path, 'w') as file:
+        json.dump(plain(scene), file)
+
+# generators, `n` bodies anchored at body 0 and joined by `joint` joints at
+# the midpoints, hinge and universal axes along z
+def chain(n: int, joint: str='ball', spacing: float=SPACING) -> dict:
+    i = torch.arange(n)
+    pos = torch.zeros((n, 3), dtype=torch.float64)
+    pos[:, 0] = spacing * i
+    return _scene(pos, torch.stack([i[:-1], i[1:]], dim=1), joint)
+
+def tree(n: int, joint: str='ball', spacing: float=SPACING) -> dict:
+    # binary tree, children hang below their parent and spread out in x
+    depth = max(1, math.ceil(math.log2(n + 1)))
+    i = torch.arange(n)
+    level = torch.floor(torch.log2(i + 1.0)).long()
+    offset = i + 1 - 2 ** level
+    width = 2.0 ** (depth - level - 1)
+    pos = torch.zeros((n, 3), dtype=torch.float64)
+    pos[:, 0] = spacing * width * (2 * offset + 1 - 2 ** level)
+    pos[:, 1] = -spacing * level
+    return _scene(pos, torch.stack([(i[1:] - 1) // 2, i[1:]], dim=1), joint)
+
+def grid(n: int, joint: str='ball', spacing: float=SPACING) -> dict:
+    # bodies on a square lattice, joined to their right and lower neighbour
+    side = math.ceil(math.sqrt(n))
+    i = torch.arange(n)
+    pos = torch.zeros((n, 3), dtype=torch.float64)
+    pos[:, 0] = spacing * (i % side)
+    pos[:, 1] = -spacing * (i // side)
+
+    neighbours = torch.stack([i + 1, i + side], dim=1)
+    valid = torch.stack([((i + 1) % side != 0) & (i + 1 < n), i + side < n],
+                        dim=1)
+    pairs = torch.stack([i.reshape(-1, 1).expand(-1, 2), neighbours], dim=2)
+    return _scene(pos, pairs[valid], joint)
+
+GENERATORS = {
+    'chain': chain,
+    'tree': tree,
+    'grid': grid,
+}
+
+def _scene(pos: torch.Tensor, pairs: torch.Tensor, joint: str) -> dict:
+    fixed = torch.zeros((len(pos),), dtype=torch.bool)
+    fixed[0] = True
+    table = {'type': joint, 'bodies': pairs}
+    if joint != 'fixed':
+        table['pos'] = (pos[pairs[:, 0]] + pos[pairs[:, 1]]) / 2
+    if joint in ('hinge', 'universal'):
+        table['axis'] = pos.new_tensor([0, 0, 1]).expand(len(pairs), 3)
+    return {
+        'bodies': {'pos': pos, 'pos_fixed': fixed, 'rot_fixed': fixed},
+        'joints': [table] if len(pairs) else [],
+    }
@@ -1,24 +1,152 @@
+import struct
+import time
 import torch
-from typing import TYPE_CHECKING
-from vpython import rate
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TYPE_CHECKING
 
-from utils import solve
+from island import Island
+from joints import JointGroup
+from profiler import NullProfiler
+from state import BodyState, StateView
+from tree_solver import TreeSolver
+from utils import dof_gravity, solve, solve_cg, solve_schur
 
 if TYPE_CHECKING:
     from objects import BaseObject
     from joints import BaseJoint
+    from observer import Observer
+    from profiler import Profiler
 
+# snapshot blob: header, then every tensor of _snapshot_tensors as float64
+SNAPSHOT_MAGIC = b'DSIMSNAP'
+SNAPSHOT_VERSION = 3
+SNAPSHOT_HEADER = struct.Struct('<8sIIIQQ')
 
 class Simulation:
-    def __init__(self, fps: int, pause: bool=False):
+    def __init__(self,
+                 fps: int,
+                 pause: bool=False,
+                 solver: str='schur',
+                 dt: Optional[float]=None,
+                 substeps: Optional[int]=None,
+                 profiler: Optional['Profiler']=None,
+                 tolerance: float=1e-6,
+                 max_iterations: int=200,
+                 threads: Optional[int]=None,
+                 sleep_time: Optional[float]=None,
+                 sleep_velocity: float=1e-2,
+                 sleep_residual: float=1e-4,
+                 tree_solver: Optional[bool]=None,
+                 compiled: bool=False,
+                 dtype: torch.dtype=torch.float64,
+                 residual_guard: Optional[float]=None,
+                 guard_action: str='warn'):
+        assert solver in ('schur', 'dense', 'cg'), "Unknown solver"
+        assert dtype in (torch.float32, torch.float64), "Unknown dtype"
+        assert guard_action in ('warn', 'promote'), "Unknown guard action"
+
+        # fps is the display rate, dt the physics timestep. every displayed
+        # frame advances the physics by `substeps` steps
         self._fps = fps
+        self._dt = dt if dt is not None else 1 / fps
+        self._substeps = substeps if substeps is not None \
+            else max(1, round(1 / (fps * self._dt)))
+        self._solver = solver
+        # 'cg' only, relative residual and iteration cap per step
+        self._tolerance = tolerance
+        self._max_iterations = max_iterations
+        self._solver_stats = {}
+        # independent islands are solved on up to `threads` threads, by
+        # default as many as torch uses (see sweep.py for worker budgets)
+        self._threads = threads if threads is not None \
+            else torch.get_num_threads()
+        self._executor = None
+        # islands without loops are solved in linear time by TreeSolver. by
+        # default only with 'schur', a 'dense' or 'cg' solver asked for
+        # solves every island itself
+        self._use_tree_solver = tree_solver if tree_solver is not None \
+            else solver == 'schur'
+        self._tree_solver: Optional[TreeSolver] = None
+        self._general_islands: list[Island] = []
+        # torch.compile of the assembly and the tree solve, traced again
+        # whenever the reduced system changes
+        self._compiled = compiled
+        self._compiled_system = None
+        self._compiled_tree_solve = None
+        # islands at rest for sleep_time seconds fall asleep, None disables
+        self._sleep_time = sleep_time
+        self._sleep_velocity = sleep_velocity
+        self._sleep_residual = sleep_residual
+        # precision of the state, joint params and every solver buffer. in
+        # single precision the largest constraint residual of a step is
+        # checked against residual_guard: 'warn' warns, 'promote' runs the
+        # following steps in double precision until it is below again
+        self._dtype = dtype
+        self._base_dtype = dtype
+        self._residual_guard = residual_guard
+        self._guard_action = guard_action
+        self._guard_trips = 0
+        self._guard_warned = False
+        self._residual = 0.0
         self._running = True
         self._pause = pause
+        self._realtime = True
+        self._initialized = False
+        # bodies or joints added after init, the scene is built again before
+        # the next step
+        self._scene_changed = False
+        self._num_steps = 0
         self._object_list: list['BaseObject'] = []
+        self._state = BodyState(dtype=dtype)
         self._joint_list: list['BaseJoint'] = []
+        self._joint_groups: list[JointGroup] = []
+        self._active_groups: list[JointGroup] = []
+        # (active group, group, index) of the groups that are partly asleep,
+        # the params of an active group are copies there
+        self._selections: list[
+            tuple[JointGroup, JointGroup, torch.Tensor]
+        ] = []
+        self._group_rows: list[int] = []
+        self._row_start = None
+        self._observers: list['Observer'] = []
+        self._profiler = profiler if profiler is not None else NullProfiler()
 
+        self._free = None
+        self._movable = None
+        self._dof_mass = None
+        self._dof_gravity = None
         self._M = None
-        self._epsilon_mat = None
+        self._M_inv = None
+        self._V_q = None
+        self._free_dofs = None
+        self._active_rows = None
+        self._lambda_rows = None
+        self._G_entries = None
+        self._G_indices = None
+        self._islands: list[Island] = []
+        self._body_island = None
+        self._body_active_island = None
+        self._dof_island = None
+        self._row_island = None
+        self._rest_time = None
+        # external force on every body when it fell asleep
+        self._sleep_force = None
+        # step workspace, see _build_workspace
+        self._dq = None
+        self._v = None
+        self._f = None
+        self._g_all = None
+        self._g = None
+        self._G_all = None
+        self._G_vals = None
+        self._B1 = None
+        self._B1_gravity = None
+        self._B2 = None
+        self._v_free = None
+        self._lambda_active = None
+        self._v_next = None
+        self._num_constraints = 0
         
         self._tau = 0.005
         self._Lambda = 1 / (1 + 4 * self._tau / self.h)
@@ -31,8 +159,63 @@ class Simulation:
     
     @property
     def h(self) -> float:
-        return 1 / self._fps
+        return self._dt
+
+    @property
+    def dt(self) -> float:
+        return self._dt
+
+    @property
+    def substeps(self) -> int:
+        return self._substeps
+
+    @property
+    def realtime(self) -> bool:
+        return self._realtime
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+    @property
+    def num_steps(self) -> int:
+        return self._num_steps
+
+    @property
+    def time(self) -> float:
+        return self._num_steps * self._dt
     
+    @property
+    def solver(self) -> str:
+        return self._solver
+
+    @property
+    def tolerance(self) -> float:
+        return self._tolerance
+
+    @property
+    def max_iterations(self) -> int:
+        return self._max_iterations
+
+    # what the solver reported for the last step, e.g. cg_residual
+    @property
+    def solver_stats(self) -> dict:
+        return self._solver_stats
+
+    # precision the next step runs in
+    @property
+    def dtype(self) -> torch.dtype:
+        return self._dtype
+
+    @property
+    def residual_guard(self) -> Optional[float]:
+        return self._residual_guard
+
+    # steps that started with a residual above residual_guard
+    @property
+    def guard_trips(self) -> int:
+        return self._guard_trips
+
     @property
     def running(self) -> bool:
         return self._running
@@ -41,6 +224,26 @@ class Simulation:
     def pause(self) -> bool:
         return self._pause
     
+    @property
+    def state(self) -> BodyState:
+        return self._state
+
+    @property
+    def objects(self) -> list['BaseObject']:
+        return self._object_list
+
+    @property
+    def joints(self) -> list['BaseJoint']:
+        return self._joint_list
+
+    @property
+    def observers(self) -> list['Observer']:
+        return self._observers
+
+    @property
+    def profiler(self) -> 'Profiler':
+        return self._profiler
+
     @property
     def num_objects(self) -> int:
         return len(self._object_list)
@@ -49,6 +252,63 @@ class Simulation:
     def num_joints(self) -> int:
         return len(self._joint_list)
 
+    # the islands that are awake
+    @property
+    def islands(self) -> list[Island]:
+        return self._islands
+
+    @property
+    def sleep_time(self) -> Optional[float]:
+        return self._sleep_time
+
+    @property
+    def asleep(self) -> torch.Tensor:
+        # per body
+        if self._sleep_time is None or self._rest_time is None:
+            return torch.zeros((self.num_objects,), dtype=torch.bool)
+        return self._rest_time >= self._sleep_time
+
+    @property
+    def num_constraints(self) -> int:
+        return self._num_constraints
+
+    # constraint multipliers of the last step, one per constraint row
+    @property
+    def lambda_(self) -> torch.Tensor:
+        return self._lambda
+
+    # constraint damping of B2 and the regularization E = epsilon per island
+    @property
+    def Lambda(self) -> float:
+        return self._Lambda
+
+    @property
+    def epsilon(self) -> float:
+        return self._epsilon
+
+    # layout of the system: the joint groups and the first row of each in
+    # lambda_, then the free dofs and active rows (rows of lambda_) of the
+    # awake part with the island of every active row
+    @property
+    def joint_groups(self) -> list[JointGroup]:
+        return self._joint_groups
+
+    @property
+    def group_rows(self) -> list[int]:
+        return self._group_rows
+
+    @property
+    def free_dofs(self) -> torch.Tensor:
+        return self._free_dofs
+
+    @property
+    def lambda_rows(self) -> torch.Tensor:
+        return self._lambda_rows
+
+    @property
+    def row_island(self) -> torch.Tensor:
+        return self._row_island
+
     @running.setter
     def running(self, value: bool) -> None:
         self._running = value
@@ -57,78 +317,720 @@ class Simulation:
     def pause(self, value: bool) -> None:
         self._pause = value
 
+    @tolerance.setter
+    def tolerance(self, value: float) -> None:
+        self._tolerance = value
+
+    @max_iterations.setter
+    def max_iterations(self, value: int) -> None:
+        self._max_iterations = value
+
+    @profiler.setter
+    def profiler(self, value: Optional['Profiler']) -> None:
+        self._profiler = value if value is not None else NullProfiler()
+
     def init(self) -> None:
-        self._M = torch.vstack([
-            torch.hstack([
-                torch.zeros((6, 6 * i)),
-                obj.mass * torch.eye(6),
-                torch.zeros((6, 6 * (self.num_objects - i - 1)))
-            ]) for i, obj in enumerate(self._object_list)
-        ])
+        self._build_scene()
+        self._initialized = True
+        for observer in self._observers:
+            observer.init(self)
+
+    def _rebuild_scene(self) -> None:
+        # bodies or joints were added after init. multipliers carry over by
+        # joint and row, and everything wakes up since the new parts may
+        # hang on a sleeping island
+        keys, lambda_ = self._row_keys(), self._lambda
+        self._scene_changed = False
+        self._build_scene()
+
+        source = torch.full((6 * self.num_joints,), -1)
+        source[keys] = torch.arange(len(keys))
+        source = source[self._row_keys()]
+        carried = source >= 0
+        self._lambda[carried] = lambda_[source[carried]]
+
+        for observer in self._observers:
+            observer.on_rebuild(self)
 
-        g = torch.hstack([
-            joint.g for joint in self._joint_list
+    def _row_keys(self) -> torch.Tensor:
+        # 6 * joint index + row within the joint, of every row. no joint
+        # has more rows than a fixed joint's 6
+        keys = [
+            (6 * torch.as_tensor([joint.index for joint in group.joints])
+             .reshape(-1, 1) + torch.arange(group.joint_type.num_rows))
+            .reshape(-1)
+            for group in self._joint_groups
+        ]
+        return torch.cat(keys) if keys else torch.zeros((0,), dtype=int)
+
+    def _build_scene(self) -> None:
+        # only free degrees of freedom enter the system
+        state = self._state
+        self._free = torch.stack(
+            [~state.pos_fixed] * 3 + [~state.rot_fixed] * 3, dim=1
+        ).reshape(-1)
+        self._movable = self._free.reshape(-1, 6).any(dim=1)
+
+        self._dof_mass = state.mass.to(self._dtype).repeat_interleave(6)
+        self._dof_gravity = dof_gravity(self._dof_mass).reshape(-1, 1)
+
+        # joints of the same type are evaluated together, rows are laid out
+        # group by group
+        self._joint_groups = JointGroup.group(self._joint_list)
+        self._group_rows = []
+        row_start = []
+        num_constraints = 0
+        for group in self._joint_groups:
+            self._group_rows.append(num_constraints)
+            num_rows = group.joint_type.num_rows
+            row_start.append(num_constraints + num_rows * torch.arange(
+                group.num_joints
+            ).repeat_interleave(num_rows))
+            num_constraints += group.num_rows
+        # first row of the joint every row belongs to
+        self._row_start = torch.cat(row_start) if row_start \
+            else torch.zeros((0,), dtype=int)
+
+        self._lambda = torch.zeros((num_constraints,), dtype=self._dtype)
+        self._num_constraints = num_constraints
+        self._rest_time = torch.zeros((self.num_objects,), dtype=self._dtype)
+        self._sleep_force = torch.zeros(
+            (self.num_objects, 6), dtype=self._dtype
+        )
+
+        self._build_system()
+        # islands of the whole scene, they fall asleep and wake up as a unit
+        self._body_island = torch.full((self.num_objects,), -1)
+        for i, island in enumerate(self._islands):
+            self._body_island[island.bodies] = i
+
+        if len(self._islands) > 1 and self._threads > 1 \
+                and self._executor is None:
+            self._executor = ThreadPoolExecutor(self._threads)
+
+    def _build_system(self) -> None:
+        # the reduced system over the awake part of the scene, rebuilt
+        # whenever an island falls asleep or wakes up
+        self._build_pattern()
+        self._M = self._dof_mass[self._free_dofs]
+        self._M_inv = 1 / self._M
+        self._V_q = self._dof_gravity[self._free_dofs]
+
+        self._tree_solver = None
+        self._general_islands = self._islands
+        if self._use_tree_solver:
+            row_joint = self._row_start[self._lambda_rows]
+            trees = [
+                island for island in self._islands
+                if island.num_rows and TreeSolver.is_tree(
+                    island, self._free_dofs, self._G_indices, row_joint
+                )
+            ]
+            if trees:
+                self._tree_solver = TreeSolver(
+                    trees, self._free_dofs, self._G_indices, row_joint,
+                    self._lambda_rows - row_joint, self._M
+                )
+                self._general_islands = [
+                    island for island in self._islands
+                    if not any(island is tree for tree in trees)
+                ]
+
+        self._build_workspace()
+
+    def _build_pattern(self) -> None:
+        # free dofs, active rows, the sparsity pattern of G and the islands
+        # of the awake part of the scene
+        awake = self._movable & ~self.asleep
+        free = self._free & awake.repeat_interleave(6)
+        self._free_dofs = free.nonzero().squeeze(1)
+        dof_map = torch.full((6 * self.num_objects,), -1)
+        dof_map[self._free_dofs] = torch.arange(len(self._free_dofs))
+
+        # sparsity pattern of G: every joint fills two (rows x 6) blocks.
+        # joints between sleeping or fixed bodies are left out
+        self._active_groups = []
+        self._selections = []
+        rows, cols, global_rows = [], [], []
+        row = 0
+        for group, group_row in zip(self._joint_groups, self._group_rows):
+            index = (awake[group.idx1] | awake[group.idx2]).nonzero()
+            if not len(index):
+                continue
+            if len(index) < group.num_joints:
+                selection = group.select(index.squeeze(1))
+                self._selections.append((selection, group, index.squeeze(1)))
+                group = selection
+            self._active_groups.append(group)
+
+            group_rows, group_cols = group.pattern(row)
+            rows.append(group_rows)
+            cols.append(group_cols)
+            num_rows = group.joint_type.num_rows
+            global_rows.append(
+                (group_row + num_rows * index + torch.arange(num_rows))
+                .reshape(-1)
+            )
+            row += group.num_rows
+        rows = torch.cat(rows) if rows else torch.zeros((0,), dtype=int)
+        cols = torch.cat(cols) if cols else torch.zeros((0,), dtype=int)
+        global_rows = torch.cat(global_rows) if global_rows \
+            else torch.zeros((0,), dtype=int)
+
+        # drop entries on fixed dofs and rows left without any entry
+        keep = free[cols]
+        active = torch.zeros((row,), dtype=torch.bool)
+        active[rows[keep]] = True
+        self._active_rows = active.nonzero().squeeze(1)
+        self._lambda_rows = global_rows[self._active_rows]
+        row_map = torch.full((row,), -1)
+        row_map[self._active_rows] = torch.arange(len(self._active_rows))
+
+        self._G_entries = keep.nonzero().squeeze(1)
+        self._G_indices = torch.vstack([
+            row_map[rows[keep]],
+            dof_map[cols[keep]]
         ])
-        self._epsilon_mat = torch.ones((len(g), len(g))) * self._epsilon
-        self._lambda = torch.zeros((len(g),))
 
-    def add_object(self, object: 'BaseObject') -> int:
+        # mechanisms that share no constraint are solved separately
+        self._islands = Island.find(
+            self.num_objects, self._free_dofs, self._G_indices, self._epsilon,
+            self._dtype
+        )
+
+        self._dof_island = torch.zeros((len(self._free_dofs),), dtype=int)
+        self._row_island = torch.zeros((len(self._active_rows),), dtype=int)
+        self._body_active_island = torch.full((self.num_objects,), -1)
+        for i, island in enumerate(self._islands):
+            self._dof_island[island.dofs] = i
+            self._row_island[island.rows] = i
+            self._body_active_island[island.bodies] = i
+
+    def _build_workspace(self) -> None:
+        # every buffer of a step is allocated here, once per topology, and
+        # update() writes into them in place
+        num_free = len(self._free_dofs)
+        num_rows = len(self._active_rows)
+        dtype = self._dtype
+        self._dq = torch.zeros((self.num_objects, 6), dtype=dtype)
+        self._v = torch.zeros((num_free, 1), dtype=dtype)
+        self._f = torch.zeros((num_free, 1), dtype=dtype)
+        self._g_all = torch.zeros((sum(
+            group.num_rows for group in self._active_groups
+        ),), dtype=dtype)
+        self._g = torch.zeros((num_rows, 1), dtype=dtype)
+        self._G_all = torch.zeros((12 * len(self._g_all),), dtype=dtype)
+        self._G_vals = torch.zeros((len(self._G_entries),), dtype=dtype)
+        self._B1 = torch.zeros((num_free, 1), dtype=dtype)
+        self._B1_gravity = -self.h * self._V_q
+        self._B2 = torch.zeros((num_rows, 1), dtype=dtype)
+        # every free dof and active row belongs to an island, the fixed
+        # dofs of v_next stay zero
+        self._v_free = torch.zeros((num_free,), dtype=dtype)
+        self._lambda_active = torch.zeros((num_rows,), dtype=dtype)
+        self._v_next = torch.zeros((self.num_objects, 6), dtype=dtype)
+        if self._solver == 'cg':
+            for island in self._general_islands:
+                if island.num_rows:
+                    island.build_csr()
+
+        if self._compiled:
+            self._compiled_system = torch.compile(self._system, dynamic=False)
+            self._compiled_tree_solve = torch.compile(
+                self._tree_solver.solve, dynamic=False
+            ) if self._tree_solver is not None else None
+
+    def add_object(self,
+                   object: 'BaseObject',
+                   pos: torch.Tensor,
+                   dir: torch.Tensor,
+                   pos_fixed: bool=False,
+                   rot_fixed: bool=False,
+                   mass: float=1) -> int:
         self._object_list.append(object)
-        return len(self._object_list) - 1
+        self._scene_changed = self._initialized
+        return self._state.add(pos, dir, pos_fixed, rot_fixed, mass)
     
     def add_joint(self, joint: 'BaseJoint') -> int:
         self._joint_list.append(joint)
+        self._scene_changed = self._initialized
         return len(self._joint_list) - 1
 
+    # bulk versions, the state is written once for all objects. return the
+    # index of the first one
+    def add_objects(self,
+                    objects: list['BaseObject'],
+                    pos: torch.Tensor,
+                    dir: torch.Tensor,
+                    pos_fixed: torch.Tensor,
+                    rot_fixed: torch.Tensor,
+                    mass: torch.Tensor) -> int:
+        self._object_list += objects
+        self._scene_changed = self._initialized
+        return self._state.extend(pos, dir, pos_fixed, rot_fixed, mass)
+
+    def add_joints(self, joints: list['BaseJoint']) -> int:
+        start = len(self._joint_list)
+        self._joint_list += joints
+        self._scene_changed = self._initialized
+        return start
+
+    # observers, e.g. render.Renderer, are optional and see every step/frame
+    def add_observer(self, observer: 'Observer') -> None:
+        self._observers.append(observer)
+
+    def remove_observer(self, observer: 'Observer') -> None:
+        self._observers.remove(observer)
+
+    def assemble_G(self) -> torch.Tensor:
+        return torch.sparse_coo_tensor(
+            self._G_indices,
+            self._G_values().clone(),
+            (len(self._active_rows), len(self._free_dofs)),
+            check_invariants=False
+        )
+
+    # both return workspace buffers, overwritten by the next call
+    def _g_values(self) -> torch.Tensor:
+        # residuals of the active rows
+        if not self._active_groups:
+            return self._g.view(-1)
+        torch.cat([
+            group.g(self._state).reshape(-1) for group in self._active_groups
+        ], out=self._g_all)
+        return torch.index_select(
+            self._g_all, 0, self._active_rows, out=self._g.view(-1)
+        )
+
+    def _G_values(self) -> torch.Tensor:
+        # values of the reduced entries, in the order of _G_indices. the
+        # blocks of every group are written straight into the workspace
+        if not self._active_groups:
+            return self._G_vals
+        start = 0
+        for group in self._active_groups:
+            end = start + 12 * group.num_rows
+            torch.cat(
+                group.G_blocks(self._state),
+                dim=-1,
+                out=self._G_all[start:end].view(
+                    group.num_joints, group.joint_type.num_rows, 12
+                )
+            )
+            start = end
+        return torch.index_select(
+            self._G_all, 0, self._G_entries, out=self._G_vals
+        )
+
     def update(self):
-        # DELE를 계산하기 위한 요소 생성
-        v = torch.hstack([
-            obj.v for obj in self._object_list
-        ]).reshape(-1, 1)
-
-        g = torch.hstack([
-            joint.g for joint in self._joint_list
-        ]).reshape(-1, 1)
-
-        f = torch.hstack([
-            obj.force for obj in self._object_list
-        ]).reshape(-1, 1)
-        
-        G = torch.vstack([
-            joint.G for joint in self._joint_list
-        ])
+        if self._scene_changed:
+            self._rebuild_scene()
+        if self._residual_guard is not None \
+                and self._base_dtype != torch.float64:
+            self._check_guard()
+        self._update()
 
-        V_q = torch.zeros((6 * self.num_objects, 1))
-        for i, obj in enumerate(self._object_list):
-            V_q[6 * i + 1][0] = (0 if obj.pos_fixed else obj.mass) * 9.80665
+    def _check_guard(self) -> None:
+        # against the residual the last step started from
+        tripped = self._residual > self._residual_guard
+        if tripped:
+            self._guard_trips += 1
+        if self._guard_action == 'warn':
+            if tripped and not self._guard_warned:
+                # one warning per simulation, guard_trips keeps the count
+                self._guard_warned = True
+                warnings.warn(
+                    f"Constraint residual exceeds {self._residual_guard:g} "
+                    f"in {self._dtype}, see Simulation.guard_trips"
+                )
+        elif tripped and self._dtype != torch.float64:
+            self._set_dtype(torch.float64)
+        elif not tripped and self._dtype != self._base_dtype:
+            self._set_dtype(self._base_dtype)
 
-        # Ax=B 행렬 생성
-        A = torch.vstack([
-            torch.hstack([self._M, -G.T]),
-            torch.hstack([G, self._epsilon_mat])
-        ])
+    def _set_dtype(self, dtype: torch.dtype) -> None:
+        # converts everything a step reads and rebuilds the system
+        self._dtype = dtype
+        self._state.set_dtype(dtype)
+        self._lambda = self._lambda.to(dtype)
+        self._rest_time = self._rest_time.to(dtype)
+        self._sleep_force = self._sleep_force.to(dtype)
+        self._dof_mass = self._dof_mass.to(dtype)
+        self._dof_gravity = self._dof_gravity.to(dtype)
+        for group in self._joint_groups:
+            group.set_dtype(dtype)
+        self._build_system()
 
-        B = torch.vstack([
-            self._M @ v - self.h * V_q + self.h * f,
-            -4 * self._Lambda / self.h * g + self._Lambda * G @ v
-        ])
+    def _update(self):
+        timer = self._profiler.begin('step')
+        stats = {}
+        if self._sleep_time is not None:
+            self._wake_moved()
+
+        state = self._state
+        if self._compiled_system is not None:
+            v, g, values, B1, B2 = self._call_compiled(
+                self._compiled_system, self._system,
+                state.pos, state.pos_before, state.dir, state.dir_before,
+                state.force
+            )
+            timer.lap('system')
+        else:
+            # DELE를 계산하기 위한 요소 생성
+            torch.sub(state.pos, state.pos_before, out=self._dq[:, 0:3])
+            torch.sub(state.dir, state.dir_before, out=self._dq[:, 3:6])
+            v = self._v
+            torch.index_select(
+                self._dq.view(-1), 0, self._free_dofs, out=v.view(-1)
+            ).div_(self.h)
+            g = self._g
+            self._g_values()
+
+            f = self._f
+            torch.index_select(
+                state.force.reshape(-1), 0, self._free_dofs, out=f.view(-1)
+            )
+            timer.lap('gather')
+
+            values = self._G_values()
+            G = torch.sparse_coo_tensor(
+                self._G_indices,
+                values,
+                (len(self._active_rows), len(self._free_dofs)),
+                check_invariants=False
+            )
+            timer.lap('jacobian')
+
+            B1 = torch.mul(self._M.reshape(-1, 1), v, out=self._B1)
+            B1.add_(self._B1_gravity).add_(f, alpha=self.h)
+            B2 = torch.mul(g, -4 * self._Lambda / self.h, out=self._B2)
+            B2.add_(torch.sparse.mm(G, v), alpha=self._Lambda)
+            timer.lap('system')
+
+        def solve_island(island: Island) -> tuple[torch.Tensor, dict]:
+            island_stats = {}
+            return self._solve_island(island, values, B1, B2, island_stats), \
+                island_stats
 
-        # 역행렬 계산
-        result = solve(A, B)
+        islands = self._general_islands
+        if self._executor is not None and len(islands) > 1:
+            results = list(self._executor.map(solve_island, islands))
+        else:
+            results = [solve_island(island) for island in islands]
+        if self._compiled_tree_solve is not None:
+            tree_result = self._call_compiled(
+                self._compiled_tree_solve, self._tree_solver.solve,
+                values, self._epsilon, B1, B2
+            )
+        elif self._tree_solver is not None:
+            tree_result = self._tree_solver.solve(
+                values, self._epsilon, B1, B2
+            )
+        timer.lap('solve')
 
         # 각 오브젝트 및 연결 요소에 대입
-        for i, obj in enumerate(self._object_list):
-            v_next = result[i * 6:(i + 1) * 6]
-            q_next = obj.q + self.h * v_next
-            obj.update(q_next)
-        self._lambda = result[6 * self.num_objects:]
+        num_free = len(self._free_dofs)
+        v_free = self._v_free
+        lambda_active = self._lambda_active
+        for island, (result, island_stats) in zip(islands, results):
+            v_free[island.dofs] = result[:len(island.dofs)]
+            lambda_active[island.rows] = result[len(island.dofs):]
+            for key, value in island_stats.items():
+                stats[key] = max(stats.get(key, value), value) \
+                    if isinstance(value, float) else stats.get(key, 0) + value
+        if self._tree_solver is not None:
+            v_free[self._tree_solver.dofs] = tree_result[0]
+            lambda_active[self._tree_solver.rows] = tree_result[1]
+        if self._residual_guard is not None:
+            self._residual = float(g.abs().max()) if len(g) else 0.0
+            stats['residual'] = self._residual
+        stats['islands'] = len(self._islands)
+        stats['tree_islands'] = self._tree_solver.num_islands \
+            if self._tree_solver is not None else 0
 
-        for joint in self._joint_list:
-            joint.update()
+        v_next = self._v_next
+        v_next.view(-1)[self._free_dofs] = v_free
+        self._lambda[self._lambda_rows] = lambda_active
+
+        self._state.integrate(v_next, self.h)
+        self._num_steps += 1
+        self._solver_stats = stats
+        timer.lap('integrate')
+
+        if self._sleep_time is not None and self._islands:
+            self._update_rest_time(v_free, g)
+            timer.lap('sleep')
+
+        for observer in self._observers:
+            observer.on_step(self)
+        timer.lap('observers')
+
+        timer.end(
+            step=self._num_steps,
+            num_free=num_free,
+            num_rows=len(self._active_rows),
+            **stats
+        )
+
+    def _system(self,
+                pos: torch.Tensor,
+                pos_before: torch.Tensor,
+                dir: torch.Tensor,
+                dir_before: torch.Tensor,
+                force: torch.Tensor) -> tuple[torch.Tensor, ...]:
+        # v, g, G's reduced entries, B1 and B2 of a step as a pure function
+        # of the state, what compiled=True traces instead of the in place
+        # assembly. G v is a scatter, sparse tensors do not compile
+        state = StateView(
+            pos, dir, self._state.pos_fixed, self._state.rot_fixed
+        )
+        v = torch.cat([pos - pos_before, dir - dir_before], dim=1) / self.h
+        v = v.reshape(-1)[self._free_dofs].reshape(-1, 1)
+        f = force.reshape(-1)[self._free_dofs].reshape(-1, 1)
+
+        if self._active_groups:
+            g = torch.cat([
+                group.g(state).reshape(-1) for group in self._active_groups
+            ])[self._active_rows].reshape(-1, 1)
+            values = torch.cat([
+                torch.cat(group.G_blocks(state), dim=-1).reshape(-1)
+                for group in self._active_groups
+            ])[self._G_entries]
+        else:
+            g = torch.zeros((0, 1), dtype=pos.dtype)
+            values = torch.zeros((0,), dtype=pos.dtype)
+
+        rows, cols = self._G_indices
+        Gv = torch.zeros_like(g).index_add_(
+            0, rows, values.reshape(-1, 1) * v[cols]
+        )
+        B1 = self._M.reshape(-1, 1) * v + self._B1_gravity + self.h * f
+        B2 = -4 * self._Lambda / self.h * g + self._Lambda * Gv
+        return v, g, values, B1, B2
+
+    def _call_compiled(self,
+                       compiled: Callable,
+                       eager: Callable,
+                       *args) -> Any:
+        # a backend that can not compile here (e.g. no C++ compiler) turns
+        # compiled mode off for good, the step then runs eagerly
+        try:
+            return compiled(*args)
+        except Exception as error:
+            warnings.warn(f"Compiled step failed, running eagerly: {error}")
+            self._compiled = False
+            self._compiled_system = None
+            self._compiled_tree_solve = None
+            return eager(*args)
+
+    def _solve_island(self,
+                      island: Island,
+                      values: torch.Tensor,
+                      B1: torch.Tensor,
+                      B2: torch.Tensor,
+                      stats: dict) -> torch.Tensor:
+        # [v, lambda] of one island, v alone if it has no constraints
+        if not island.num_rows:
+            return self._M_inv[island.dofs] * B1[island.dofs].reshape(-1)
+
+        if self._solver == 'dense':
+            # Ax=B 행렬 생성, the island's buffers are filled in place
+            A = island.kkt_matrix(self._M, values)
+            B = island.kkt_rhs(B1, B2)
+
+            # 역행렬 계산
+            return solve(A, B, stats)
+
+        M_inv = self._M_inv[island.dofs]
+        B1 = B1[island.dofs]
+        B2 = B2[island.rows]
+
+        if self._solver == 'schur':
+            return solve_schur(
+                island.G(values), M_inv, island.epsilon_mat, B1, B2, stats
+            )
+
+        # warm started from the multipliers of the previous step
+        return solve_cg(
+            *island.G_csr(values), M_inv, self._epsilon, B1, B2,
+            self._lambda[self._lambda_rows[island.rows]],
+            self._tolerance, self._max_iterations, stats
+        )
+
+    # sleeping: an island whose velocities and constraint residuals stay
+    # below the thresholds for sleep_time seconds is frozen and left out of
+    # the system until something moves or pushes one of its bodies
+    def wake(self, bodies: Optional[torch.Tensor]=None) -> None:
+        # wakes the islands of `bodies` (indices or mask), all if None
+        islands = self._body_island[bodies] if bodies is not None \
+            else self._body_island
+        mask = torch.isin(self._body_island, islands) & self._movable
+        waking = (self.asleep & mask).any()
+        self._rest_time[mask] = 0
+        if waking:
+            self._build_system()
+
+    def _wake_moved(self) -> None:
+        asleep = self.asleep
+        if not asleep.any():
+            return
+
+        # sleeping bodies are at rest under the force they fell asleep
+        # with, so any difference is a user's push
+        state = self._state
+        moved = asleep & (
+            (state.force != self._sleep_force).any(dim=1)
+            | (state.pos != state.pos_before).any(dim=1)
+            | (state.dir != state.dir_before).any(dim=1)
+        )
+        if moved.any():
+            self.wake(moved)
+
+    def _update_rest_time(self, v: torch.Tensor, g: torch.Tensor) -> None:
+        num_islands = len(self._islands)
+        speed = v.new_zeros((num_islands,)).scatter_reduce_(
+            0, self._dof_island, v.abs(), 'amax'
+        )
+        residual = g.new_zeros((num_islands,)).scatter_reduce_(
+            0, self._row_island, g.reshape(-1).abs(), 'amax'
+        )
+        quiet = (speed < self._sleep_velocity) \
+            & (residual < self._sleep_residual)
+
+        active = self._body_active_island >= 0
+        body_quiet = quiet[self._body_active_island[active]]
+        self._rest_time[active] = torch.where(
+            body_quiet, self._rest_time[active] + self._dt, 0
+        )
+
+        falling = active & (self._rest_time >= self._sleep_time)
+        if falling.any():
+            # asleep at rest, the next step must not see a velocity
+            state = self._state
+            state.pos_before[falling] = state.pos[falling]
+            state.dir_before[falling] = state.dir[falling]
+            state.touch()
+            self._sleep_force[falling] = state.force[falling]
+            self._build_system()
+
+    # checkpointing, a snapshot restores into this or any other simulation
+    # of the same scene, e.g. to fork runs from one warm state
+    def snapshot(self) -> bytes:
+        if not self._initialized:
+            self.init()
+        elif self._scene_changed:
+            self._rebuild_scene()
+
+        tensors = self._snapshot_tensors()
+        count = sum(tensor.numel() for tensor in tensors)
+        blob = bytearray(SNAPSHOT_HEADER.size + 8 * count)
+        SNAPSHOT_HEADER.pack_into(
+            blob, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.num_objects,
+            self._num_constraints, self._num_steps, count
+        )
+
+        data = torch.frombuffer(
+            blob, dtype=torch.float64, offset=SNAPSHOT_HEADER.size
+        )
+        offset = 0
+        for tensor in tensors:
+            data[offset:offset + tensor.numel()] = tensor.reshape(-1)
+            offset += tensor.numel()
+        del data
+
+        return bytes(blob)
+
+    def restore(self, blob: bytes) -> None:
+        if not self._initialized:
+            self.init()
+        elif self._scene_changed:
+            self._rebuild_scene()
+
+        magic, version, num_objects, num_constraints, num_steps, count = \
+            SNAPSHOT_HEADER.unpack_from(blob, 0)
+        assert magic == SNAPSHOT_MAGIC, "Not a snapshot"
+        assert version == SNAPSHOT_VERSION, "Unsupported snapshot version"
+        assert num_objects == self.num_objects \
+            and num_constraints == self._num_constraints, "Scene mismatch"
+
+        tensors = self._snapshot_tensors()
+        assert count == sum(tensor.numel() for tensor in tensors), \
+            "Scene mismatch"
+
+        data = torch.frombuffer(
+            bytearray(blob), dtype=torch.float64, offset=SNAPSHOT_HEADER.size
+        )
+        asleep = self.asleep
+        offset = 0
+        for tensor in tensors:
+            tensor.copy_(
+                data[offset:offset + tensor.numel()].view(tensor.shape)
+            )
+            offset += tensor.numel()
+
+        self._num_steps = num_steps
+        self._state.touch()
+        # everything else is restored in place, the system only changes if
+        # some island fell asleep or woke up
+        if not torch.equal(self.asleep, asleep):
+            self._build_system()
+            return
+        for selection, group, index in self._selections:
+            for key, value in selection.params.items():
+                value.copy_(group.params[key][index])
+
+    def _snapshot_tensors(self) -> list[torch.Tensor]:
+        # everything that changes while stepping or differs between forks,
+        # restored in place
+        state = self._state
+        return [
+            state.pos, state.pos_before, state.dir, state.dir_before,
+            state.force, self._lambda, self._rest_time, self._sleep_force
+        ] + [
+            value
+            for group in self._joint_groups
+            for _, value in sorted(group.params.items())
+        ]
+
+    def step(self, n: int=1) -> None:
+        # n physics steps in a tight loop, no frames are rendered
+        if not self._initialized:
+            self.init()
+
+        for _ in range(n):
+            self.update()
+
+    def run(self, realtime: bool=True, duration: Optional[float]=None):
+        # realtime=False renders frames as fast as the physics allows.
+        # duration is in simulated seconds from now, None runs until
+        # stopped. paused frames advance no simulated time, so a paused run
+        # only ends once it is unpaused or stopped, e.g. by an observer
+        if not self._initialized:
+            self.init()
+        self._realtime = realtime
+        throttled = any(observer.throttles for observer in self._observers)
+        frame_time = 1 / self._fps
+        next_frame = time.perf_counter()
+        end_step = self._num_steps + round(duration / self._dt) \
+            if duration is not None else None
 
-    def run(self):
-        self.init()
         while self.running:
+            if end_step is not None and self._num_steps >= end_step:
+                break
+            timer = self._profiler.begin('frame')
             if not self.pause:
-                self.update()
-            rate(self.fps)
\ No newline at end of file
+                self.step(self._substeps)
+            timer.lap('physics')
+            for observer in self._observers:
+                observer.on_frame(self)
+            timer.lap('observers')
+
+            if realtime and not throttled:
+                next_frame += frame_time
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame = time.perf_counter()
+            timer.lap('idle')
+            timer.end(step=self._num_steps)
\ No newline at end of file
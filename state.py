@@ -0,0 +1,291 @@
+import torch
+
+from utils import rotation_matrix, ang_vel_coeff_matrix
+
+
+def kinematics(dir: torch.Tensor,
+               pos_fixed: torch.Tensor,
+               rot_fixed: torch.Tensor
+               ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    # rotation matrices and velocity coefficient matrices of every body,
+    # rows of fixed dofs are zero
+    free_pos = ~pos_fixed.reshape(-1, 1, 1)
+    free_rot = ~rot_fixed.reshape(-1, 1, 1)
+    return \
+        rotation_matrix(dir), \
+        (free_pos * torch.eye(3, dtype=dir.dtype)).expand(*dir.shape, 3), \
+        ang_vel_coeff_matrix(dir) * free_rot
+
+
+class BodyState:
+    def __init__(self, capacity: int=16, dtype: torch.dtype=torch.float64):
+        self._size = 0
+        self._capacity = 0
+        self._pos = torch.zeros((0, 3), dtype=dtype)
+        self._pos_before = torch.zeros((0, 3), dtype=dtype)
+        self._dir = torch.zeros((0, 3), dtype=dtype)
+        self._dir_before = torch.zeros((0, 3), dtype=dtype)
+        self._force = torch.zeros((0, 6), dtype=dtype)
+        self._pos_fixed = torch.zeros((0,), dtype=torch.bool)
+        self._rot_fixed = torch.zeros((0,), dtype=torch.bool)
+        self._mass = torch.zeros((0,), dtype=torch.float64)
+        self._reserve(capacity)
+
+        # kinematics cache, recomputed lazily once the state has changed
+        self._version = 0
+        self._cache_version = -1
+        self._rot_mat = None
+        self._lin_vel_coeff_mat = None
+        self._ang_vel_coeff_mat = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return self._pos.dtype
+
+    # contiguous (n x k) views over the bodies added so far, batched states
+    # carry an extra leading dimension
+    @property
+    def pos(self) -> torch.Tensor:
+        return self._pos[..., :self._size, :]
+
+    @property
+    def pos_before(self) -> torch.Tensor:
+        return self._pos_before[..., :self._size, :]
+
+    @property
+    def dir(self) -> torch.Tensor:
+        return self._dir[..., :self._size, :]
+
+    @property
+    def dir_before(self) -> torch.Tensor:
+        return self._dir_before[..., :self._size, :]
+
+    @property
+    def force(self) -> torch.Tensor:
+        return self._force[..., :self._size, :]
+
+    @property
+    def pos_fixed(self) -> torch.Tensor:
+        return self._pos_fixed[:self._size]
+
+    @property
+    def rot_fixed(self) -> torch.Tensor:
+        return self._rot_fixed[:self._size]
+
+    # float64 whatever the dtype of the state, shared by a batch
+    @property
+    def mass(self) -> torch.Tensor:
+        return self._mass[:self._size]
+
+    # batched (n x 3 x 3) kinematics of every body
+    @property
+    def rot_mat(self) -> torch.Tensor:
+        self._update_cache()
+        return self._rot_mat
+
+    @property
+    def lin_vel_coeff_mat(self) -> torch.Tensor:
+        self._update_cache()
+        return self._lin_vel_coeff_mat
+
+    @property
+    def ang_vel_coeff_mat(self) -> torch.Tensor:
+        self._update_cache()
+        return self._ang_vel_coeff_mat
+
+    @property
+    def q(self) -> torch.Tensor:
+        return torch.cat([self.pos, self.dir], dim=-1)
+
+    def v(self, h: float) -> torch.Tensor:
+        return torch.cat([
+            self.pos - self.pos_before,
+            self.dir - self.dir_before
+        ], dim=-1) / h
+
+    def add(self,
+            pos: torch.Tensor,
+            dir: torch.Tensor,
+            pos_fixed: bool=False,
+            rot_fixed: bool=False,
+            mass: float=1) -> int:
+        if self._size == self._capacity:
+            self._reserve(2 * self._capacity)
+
+        index = self._size
+        self._pos[index] = pos
+        self._pos_before[index] = pos
+        self._dir[index] = dir
+        self._dir_before[index] = dir
+        self._force[index] = 0
+        self._pos_fixed[index] = pos_fixed
+        self._rot_fixed[index] = rot_fixed
+        self._mass[index] = mass
+        self._size += 1
+        self.touch()
+        return index
+
+    def extend(self,
+               pos: torch.Tensor,
+               dir: torch.Tensor,
+               pos_fixed: torch.Tensor,
+               rot_fixed: torch.Tensor,
+               mass: torch.Tensor) -> int:
+        # adds k bodies at rest at once, returns the index of the first
+        start, end = self._size, self._size + len(pos)
+        if end > self._capacity:
+            self._reserve(max(end, 2 * self._capacity))
+
+        self._pos[start:end] = pos
+        self._pos_before[start:end] = pos
+        self._dir[start:end] = dir
+        self._dir_before[start:end] = dir
+        self._force[start:end] = 0
+        self._pos_fixed[start:end] = pos_fixed
+        self._rot_fixed[start:end] = rot_fixed
+        self._mass[start:end] = mass
+        self._size = end
+        self.touch()
+        return start
+
+    def set_pos(self, index: int, value: torch.Tensor) -> None:
+        self._pos_before[..., index, :] = self._pos[..., index, :]
+        self._pos[..., index, :] = value
+        self.touch()
+
+    def set_dir(self, index: int, value: torch.Tensor) -> None:
+        self._dir_before[..., index, :] = self._dir[..., index, :]
+        self._dir[..., index, :] = value
+        self.touch()
+
+    def touch(self) -> None:
+        # call after writing into the state views directly
+        self._version += 1
+
+    def set_dtype(self, dtype: torch.dtype) -> None:
+        # converts every buffer, views taken before are not updated
+        if dtype == self.dtype:
+            return
+        self._pos = self._pos.to(dtype)
+        self._pos_before = self._pos_before.to(dtype)
+        self._dir = self._dir.to(dtype)
+        self._dir_before = self._dir_before.to(dtype)
+        self._force = self._force.to(dtype)
+        self.touch()
+
+    def integrate(self, v: torch.Tensor, h: float) -> None:
+        # q <- q + h * v for every body at once, v is (... x n x 6)
+        self.pos_before.copy_(self.pos)
+        self.dir_before.copy_(self.dir)
+        self.pos.add_(v[..., 0:3], alpha=h)
+        self.dir.add_(v[..., 3:6], alpha=h)
+        self.touch()
+
+    def _update_cache(self) -> None:
+        if self._cache_version == self._version:
+            return
+
+        self._rot_mat, self._lin_vel_coeff_mat, self._ang_vel_coeff_mat = \
+            kinematics(self.dir, self.pos_fixed, self.rot_fixed)
+        self._cache_version = self._version
+
+    def _reserve(self, capacity: int) -> None:
+        capacity = max(capacity, 1)
+        if capacity <= self._capacity:
+            return
+
+        def grow(buffer: torch.Tensor) -> torch.Tensor:
+            res = buffer.new_zeros((capacity,) + buffer.shape[1:])
+            res[:self._size] = buffer[:self._size]
+            return res
+
+        self._pos = grow(self._pos)
+        self._pos_before = grow(self._pos_before)
+        self._dir = grow(self._dir)
+        self._dir_before = grow(self._dir_before)
+        self._force = grow(self._force)
+        self._pos_fixed = grow(self._pos_fixed)
+        self._rot_fixed = grow(self._rot_fixed)
+        self._mass = grow(self._mass)
+        self._capacity = capacity
+
+
+class BatchBodyState(BodyState):
+    # B independent copies of a body state, buffers are (B x n x k)
+    def __init__(self, state: BodyState, batch_size: int):
+        super().__init__(capacity=0, dtype=state.dtype)
+        self._batch_size = batch_size
+        self._size = state.size
+        self._capacity = state.size
+
+        def expand(buffer: torch.Tensor) -> torch.Tensor:
+            return buffer.expand(batch_size, *buffer.shape).clone()
+
+        self._pos = expand(state.pos)
+        self._pos_before = expand(state.pos_before)
+        self._dir = expand(state.dir)
+        self._dir_before = expand(state.dir_before)
+        self._force = expand(state.force)
+        self._pos_fixed = state.pos_fixed.clone()
+        self._rot_fixed = state.rot_fixed.clone()
+        self._mass = state.mass.clone()
+        self.touch()
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    def add(self, *args, **kwargs) -> int:
+        raise RuntimeError("Bodies can not be added to a batched state")
+
+    def extend(self, *args, **kwargs) -> int:
+        raise RuntimeError("Bodies can not be added to a batched state")
+
+
+class StateView:
+    # the part of a BodyState the joint kernels read, for given pos and dir
+    # tensors. the kinematics are computed up front, there is no cache to
+    # update, so it can be built inside compiled functions
+    def __init__(self,
+                 pos: torch.Tensor,
+                 dir: torch.Tensor,
+                 pos_fixed: torch.Tensor,
+                 rot_fixed: torch.Tensor):
+        self._pos = pos
+        self._dir = dir
+        self._pos_fixed = pos_fixed
+        self._rot_fixed = rot_fixed
+        self._rot_mat, self._lin_vel_coeff_mat, self._ang_vel_coeff_mat = \
+            kinematics(dir, pos_fixed, rot_fixed)
+
+    @property
+    def pos(self) -> torch.Tensor:
+        return self._pos
+
+    @property
+    def dir(self) -> torch.Tensor:
+        return self._dir
+
+    @property
+    def pos_fixed(self) -> torch.Tensor:
+        return self._pos_fixed
+
+    @property
+    def rot_fixed(self) -> torch.Tensor:
+        return self._rot_fixed
+
+    @property
+    def rot_mat(self) -> torch.Tensor:
+        return self._rot_mat
+
+    @property
+    def lin_vel_coeff_mat(self) -> torch.Tensor:
+        return self._lin_vel_coeff_mat
+
+    @property
+    def ang_vel_coeff_mat(self) -> torch.Tensor:
+        return self._ang_vel_coeff_mat
@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import torch
+from typing import Callable, Optional, Union
+
+from recorder import Recorder, Replay
+from scene import build
+from simulation import Simulation
+
+# a scene is a picklable callable (module level function or
+# functools.partial) that builds a headless, not yet initialized Simulation,
+# or a scene dict as read by scene.read()
+Scene = Union[Callable[[], Simulation], dict]
+
+
+def _init_worker(threads: int) -> None:
+    # every worker gets its share of the cores, torch's pool and the
+    # island threads of Simulation both follow torch.get_num_threads()
+    torch.set_num_threads(threads)
+
+def _run_scene(index: int,
+               scene: Scene,
+               steps: int,
+               every: int,
+               path: str) -> dict:
+    start = time.perf_counter()
+    simul = scene() if callable(scene) else build(scene)
+    recorder = Recorder(path, every=every, capacity=steps // every + 1)
+    simul.add_observer(recorder)
+    simul.init()
+    setup = time.perf_counter() - start
+
+    for _ in range(steps):
+        simul.update()
+    recorder.close()
+
+    return {
+        'index': index,
+        'path': path,
+        'bodies': simul.num_objects,
+        'constraints': simul.num_constraints,
+        'setup_s': setup,
+        'run_s': time.perf_counter() - start - setup,
+    }
+
+
+class SweepResult:
+    # trajectories of a sweep in scene order. every scene was recorded by
+    # its worker into a memory mapped file under `directory` (/dev/shm
+    # where it exists), the Replay views map the same pages without a copy
+    def __init__(self,
+                 directory: str,
+                 infos: list[dict],
+                 owns_directory: bool):
+        self._directory = directory
+        self._infos = infos
+        self._owns_directory = owns_directory
+        self._replays = [Replay(info['path']) for info in infos]
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    # per scene bodies, constraints and setup / run seconds
+    @property
+    def infos(self) -> list[dict]:
+        return self._infos
+
+    @property
+    def replays(self) -> list[Replay]:
+        return self._replays
+
+    def __len__(self) -> int:
+        return len(self._replays)
+
+    def __getitem__(self, index: int) -> Replay:
+        return self._replays[index]
+
+    def __enter__(self) -> 'SweepResult':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # unmaps the trajectories and removes the files of the sweep
+        for replay in self._replays:
+            replay.close()
+        self._replays = []
+        for info in self._infos:
+            if os.path.exists(info['path']):
+                os.remove(info['path'])
+        if self._owns_directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+def sweep(scenes: list[Scene],
+          steps: int,
+          every: int=1,
+          processes: Optional[int]=None,
+          threads: Optional[int]=None,
+          directory: Optional[str]=None) -> SweepResult:
+    # runs every scene for `steps` steps in a pool of `processes` spawned
+    # workers, each limited to `threads` torch threads (the cores split
+    # evenly by default). only file names and timings go back through
+    # pickling, the trajectories stay in the shared files
+    assert steps >= 1 and every >= 1, "steps and every must be positive"
+    num_cores = os.cpu_count() or 1
+    processes = processes if processes is not None \
+        else max(1, min(len(scenes), num_cores))
+    threads = threads if threads is not None \
+        else max(1, num_cores // processes)
+
+    owns_directory = directory is None
+    if owns_directory:
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        directory = tempfile.mkdtemp(prefix='dsim-sweep-', dir=shm)
+    jobs = [
+        (i, scene, steps, every, os.path.join(directory, f'scene_{i}.bin'))
+        for i, scene in enumerate(scenes)
+    ]
+
+    # spawn, as forked workers would inherit torch's thread pool state
+    context = multiprocessing.get_context('spawn')
+    try:
+        with context.Pool(
+            processes, initializer=_init_worker, initargs=(threads,)
+        ) as pool:
+            infos = pool.starmap(_run_scene, jobs, chunksize=1)
+    except BaseException:
+        if owns_directory:
+            shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    return SweepResult(directory, infos, owns_directory)
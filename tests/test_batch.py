@@ -0,0 +1,36 @@
+import pytest
+import torch
+
+import scene
+from batch import BatchSimulation
+from simulation import Simulation
+
+MASSES = [1.0, 2.5, 0.4]
+
+def build(solver: str, mass: float=1.0) -> Simulation:
+    part = scene.tree(7, 'ball')
+    part['bodies']['mass'] = torch.full((7,), mass, dtype=torch.float64)
+    simul = Simulation(fps=60, solver=solver, tree_solver=False)
+    scene.load(simul, part)
+    simul.init()
+    return simul
+
+@pytest.mark.parametrize('solver', ['schur', 'dense'])
+def test_matches_separate_worlds(solver):
+    # every world of the batch steps like a simulation of its own
+    batch = BatchSimulation(build(solver), len(MASSES))
+    for obj in batch.objects[1:]:
+        batch.set_mass(obj, torch.tensor(MASSES, dtype=torch.float64))
+    worlds = [build(solver, mass) for mass in MASSES]
+
+    for _ in range(10):
+        batch.update()
+        for world in worlds:
+            world.update()
+    for i, world in enumerate(worlds):
+        assert torch.allclose(
+            batch.state.pos[i], world.state.pos, rtol=0, atol=1e-12
+        )
+        assert torch.allclose(
+            batch.lambda_[i], world.lambda_, rtol=0, atol=1e-11
+        )
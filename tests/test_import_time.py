@@ -0,0 +1,12 @@
+from benchmark import measure_imports
+
+# the physics core on top of torch, in fresh interpreters. vpython is only
+# imported by render/ and convert_to_vector, see benchmark.py --import-budget
+IMPORT_BUDGET_MS = 50
+
+def test_core_imports_within_budget():
+    result = measure_imports(repeats=3)
+    assert result['core_import_ms'] < IMPORT_BUDGET_MS, result
+
+def test_core_imports_without_vpython():
+    assert not measure_imports(repeats=1)['vpython_loaded']
@@ -0,0 +1,56 @@
+import torch
+
+from joints import HingeJoint
+from objects import Box
+from simulation import Simulation
+
+def falling_box() -> tuple[Simulation, Box]:
+    simul = Simulation(fps=60)
+    box = Box(simul, pos=(0, 0, 0))
+    simul.init()
+    return simul, box
+
+def test_getters_return_copies():
+    simul, box = falling_box()
+    pos = box.pos
+    simul.step(10)
+    assert (box.pos - pos).abs().max() > 0
+
+    # editing a copy changes neither the state nor its kinematics
+    dir, rot_mat = box.dir, box.rot_mat
+    dir[2] += 0.5
+    assert torch.equal(box.dir, dir - torch.tensor([0, 0, 0.5]))
+    assert torch.equal(box.rot_mat, rot_mat)
+
+def test_setter_updates_kinematics():
+    simul, box = falling_box()
+    rot_mat = box.rot_mat
+    box.dir = (0, 0, 0.5)
+    assert not torch.equal(box.rot_mat, rot_mat)
+
+def test_create_many_matches_init():
+    # bulk handles read the same values as the ones of the constructors
+    simul = Simulation(fps=60)
+    box = Box(simul, pos=(1, 2, 3), mass=2.5, col=(1, 0, 0),
+              rot_fixed=True)
+    boxes = Box.create_many(
+        simul, [[1, 2, 3], [4, 5, 6]], mass=[2.5, 1], col=[[1, 0, 0]] * 2,
+        rot_fixed=[True, False]
+    )
+    joint = HingeJoint(simul, box, boxes[1], size=0.3, col=(0, 1, 0))
+    joints = HingeJoint.create_many(
+        simul, [0, 1], [2, 2], size=[0.3, 0.4], col=[[0, 1, 0]] * 2
+    )
+
+    for obj in (box, boxes[0]):
+        assert obj.mass == 2.5 and obj.size == 2.5
+        assert torch.equal(obj.color, torch.tensor([1., 0, 0]))
+        assert (obj.pos_fixed, obj.rot_fixed) == (False, True)
+    assert not boxes[1].rot_fixed
+    assert torch.equal(simul.state.mass, torch.tensor([2.5, 2.5, 1]))
+
+    for j in (joint, joints[0]):
+        assert j.size == 0.3 and j.obj2 is boxes[1]
+        assert torch.equal(j.color, torch.tensor([0., 1, 0]))
+    assert joints[0].obj1 is box and joints[1].obj1 is boxes[0]
+    assert joints[1].size == 0.4 and joints[1].group_index == 1
@@ -0,0 +1,34 @@
+import csv
+import io
+import re
+
+from profiler import ConsoleSummarySink, CsvSink, Profiler
+
+def test_console_formats_only_own_phases():
+    # a phase of one profiler is a plain number in another's records
+    Profiler().begin('step').lap('residual')
+
+    out = io.StringIO()
+    profiler = Profiler(ConsoleSummarySink(every=1, out=out))
+    timer = profiler.begin('step')
+    timer.lap('solve')
+    timer.end(step=1, residual=0.25)
+
+    line = out.getvalue()
+    assert 'residual 0.25' in line
+    assert 'residual 0.250ms' not in line
+    assert re.search(r'solve [0-9.]+ms', line)
+
+def test_csv_flattens_phases(tmp_path):
+    path = tmp_path / 'steps.csv'
+    profiler = Profiler(CsvSink(str(path)))
+    timer = profiler.begin('step')
+    timer.lap('solve')
+    timer.end(step=1, islands=2)
+    profiler.close()
+
+    with open(path, newline='') as file:
+        row, = csv.DictReader(file)
+    assert row['kind'] == 'step' and row['islands'] == '2'
+    assert float(row['solve']) >= 0 and float(row['total']) >= 0
+    assert 'phases' not in row
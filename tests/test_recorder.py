@@ -0,0 +1,19 @@
+import scene
+from recorder import Recorder, Replay
+from simulation import Simulation
+
+def test_close_detaches(tmp_path):
+    simul = Simulation(fps=60)
+    scene.load(simul, scene.chain(4, 'ball'))
+    recorder = Recorder(str(tmp_path / 'run.bin'))
+    simul.add_observer(recorder)
+    simul.step(5)
+    recorder.close()
+    assert recorder not in simul.observers
+
+    # the simulation goes on, the recording keeps its frames
+    simul.step(5)
+    replay = Replay(recorder.path)
+    assert len(replay) == 5
+    assert replay.steps.tolist() == [1, 2, 3, 4, 5]
+    replay.close()
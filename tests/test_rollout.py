@@ -0,0 +1,54 @@
+import pytest
+import torch
+
+from joints import BallJoint
+from objects import Box
+from rollout import Rollout
+from simulation import Simulation
+
+STEPS = 12
+
+def pendulum() -> Simulation:
+    # a ball joint chain of four boxes, tilted so every parameter matters
+    simul = Simulation(fps=60)
+    boxes = [Box(simul, pos=(0, 0, 0), pos_fixed=True, rot_fixed=True)]
+    for i in range(1, 5):
+        boxes.append(Box(simul, pos=(i, 0.3 * i, 1), dir=(0.3, 0.5, 0.2),
+                         mass=1 + 0.1 * i))
+        BallJoint(simul, boxes[i - 1], boxes[i], pos=(i - 0.5, 0.3 * i, 0.5))
+    simul.init()
+    return simul
+
+def test_matches_simulation():
+    simul = pendulum()
+    q = Rollout(simul).run(STEPS)
+    simul.step(STEPS)
+    assert torch.allclose(q[-1], simul.state.q, rtol=0, atol=1e-10)
+
+@pytest.mark.parametrize('checkpoint_every', [None, 5])
+def test_gradient_matches_central_difference(checkpoint_every):
+    rollout = Rollout(pendulum(), checkpoint_every=checkpoint_every)
+    params = rollout.parameters()
+    target = rollout.run(STEPS).detach() + 0.01
+
+    def loss(values: dict[str, torch.Tensor]) -> torch.Tensor:
+        return ((rollout.run(STEPS, values) - target) ** 2).sum()
+
+    for value in params.values():
+        value.requires_grad_(True)
+    loss(params).backward()
+
+    def detached() -> dict[str, torch.Tensor]:
+        return {name: value.detach().clone() for name, value in params.items()}
+
+    h = 1e-6
+    for key, index in [('mass', (3,)), ('pos', (2, 1)), ('dir', (4, 0)),
+                       ('BallJoint.pos_from_obj1', (0, 2)),
+                       ('BallJoint.pos_from_obj2', (1, 0))]:
+        plus, minus = detached(), detached()
+        plus[key][index] += h
+        minus[key][index] -= h
+        difference = (loss(plus) - loss(minus)).item() / (2 * h)
+        assert params[key].grad[index].item() == pytest.approx(
+            difference, rel=1e-5, abs=1e-8
+        ), key
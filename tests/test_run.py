@@ -0,0 +1,32 @@
+from objects import Box
+from observer import Observer
+from simulation import Simulation
+
+def falling_box(**kwargs) -> Simulation:
+    simul = Simulation(fps=60, **kwargs)
+    Box(simul, pos=(0, 0, 0))
+    return simul
+
+def test_duration_counts_from_the_call():
+    simul = falling_box()
+    simul.step(100)
+    simul.run(realtime=False, duration=1)
+    assert simul.num_steps == 160
+
+class Unpause(Observer):
+    # unpauses after a few paused frames
+    def __init__(self):
+        self.frames = 0
+
+    def on_frame(self, simul: Simulation) -> None:
+        self.frames += 1
+        if self.frames == 3:
+            simul.pause = False
+
+def test_paused_frames_do_not_count():
+    simul = falling_box(pause=True)
+    observer = Unpause()
+    simul.add_observer(observer)
+    simul.run(realtime=False, duration=0.5)
+    assert simul.num_steps == 30
+    assert observer.frames == 33
@@ -0,0 +1,35 @@
+import torch
+
+from joints import BallJoint
+from objects import Box
+from simulation import Simulation
+
+def hanging_box() -> tuple[Simulation, Box]:
+    simul = Simulation(fps=60, sleep_time=0.1)
+    anchor = Box(simul, pos=(0, 0, 0), pos_fixed=True, rot_fixed=True)
+    box = Box(simul, pos=(0, -2, 0))
+    BallJoint(simul, anchor, box, pos=(0, -1, 0))
+    simul.init()
+    return simul, box
+
+def test_constant_force_keeps_sleeping():
+    # a body falls asleep under the force it rests with and stays asleep
+    simul, box = hanging_box()
+    box.force = torch.tensor([0, -5.0, 0, 0, 0, 0], dtype=torch.float64)
+
+    asleep = []
+    for _ in range(120):
+        simul.step()
+        asleep.append(bool(simul.asleep[box.index]))
+    assert asleep[-1]
+    assert sum(a != b for a, b in zip(asleep, asleep[1:])) == 1
+
+def test_changed_force_wakes():
+    simul, box = hanging_box()
+    box.force = torch.tensor([0, -5.0, 0, 0, 0, 0], dtype=torch.float64)
+    simul.step(60)
+    assert simul.asleep[box.index]
+
+    box.force = torch.tensor([3.0, -5.0, 0, 0, 0, 0], dtype=torch.float64)
+    simul.step()
+    assert not simul.asleep[box.index]
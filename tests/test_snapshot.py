@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+import scene
+from simulation import Simulation
+
+def build(**kwargs) -> Simulation:
+    simul = Simulation(fps=60, **kwargs)
+    scene.load(simul, scene.chain(6, 'hinge'))
+    scene.load(simul, scene.tree(7, 'ball'))
+    simul.init()
+    return simul
+
+def trajectory(simul: Simulation, n: int) -> list[torch.Tensor]:
+    # pos, dir, multipliers and sleeping bodies after every step
+    states = []
+    for _ in range(n):
+        simul.step()
+        states += [
+            simul.state.pos.clone(), simul.state.dir.clone(),
+            simul.lambda_.clone(), simul.asleep
+        ]
+    return states
+
+# thresholds loose enough for islands to fall asleep within 20 steps
+SLEEP = {'sleep_time': 0.05, 'sleep_velocity': 1.0, 'sleep_residual': 1.0}
+
+# cg warm starts from the multipliers, the sleeping bodies and their rest
+# times decide the system, all of them come back from the blob
+@pytest.mark.parametrize('kwargs', [{}, {'solver': 'cg'}, SLEEP])
+def test_round_trip(kwargs):
+    simul = build(**kwargs)
+    simul.step(20)
+    blob = simul.snapshot()
+    before = trajectory(simul, 20)
+    simul.restore(blob)
+    after = trajectory(simul, 20)
+    assert all(torch.equal(a, b) for a, b in zip(before, after))
+
+def test_fork():
+    # into a fresh simulation of the same scene, some islands asleep
+    simul = build(**SLEEP)
+    simul.step(20)
+    blob = simul.snapshot()
+    asleep = simul.asleep
+    assert asleep.any() and not asleep.all()
+    before = trajectory(simul, 20)
+
+    fork = build(**SLEEP)
+    fork.restore(blob)
+    assert torch.equal(fork.asleep, asleep)
+    after = trajectory(fork, 20)
+    assert all(torch.equal(a, b) for a, b in zip(before, after))
@@ -0,0 +1,76 @@
+import torch
+
+import scene
+from simulation import Simulation
+from utils import csr_layout, solve, solve_batch, solve_cg, solve_schur, \
+    solve_schur_batch, sparse_csr
+
+def system(joint: str) -> tuple:
+    # G, M^-1 and E of a chain after a few steps, with a consistent right
+    # hand side B = A x of the dense KKT matrix A = [[M, -G^T], [G, E]]
+    simul = Simulation(fps=60)
+    scene.load(simul, scene.chain(6, joint))
+    simul.step(5)
+
+    G = simul.assemble_G()
+    M = torch.as_tensor(
+        [obj.mass for obj in simul.objects], dtype=torch.float64
+    ).repeat_interleave(6)[simul.free_dofs]
+    m, k = G.shape
+    E = torch.full((m, m), simul.epsilon, dtype=torch.float64)
+    A = torch.cat([
+        torch.cat([torch.diag(M), -G.to_dense().T], dim=1),
+        torch.cat([G.to_dense(), E], dim=1)
+    ])
+    x = torch.randn((k + m, 1), dtype=torch.float64,
+                    generator=torch.Generator().manual_seed(0))
+    B = A @ x
+    return A, B, G, 1 / M, E, simul.epsilon, B[:k], B[k:]
+
+def csr(G: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    G = G.coalesce()
+    res = []
+    for indices, shape in ((G.indices(), G.shape),
+                           (G.indices().flip(0), G.shape[::-1])):
+        crow, col, order = csr_layout(indices, shape)
+        res.append(sparse_csr(crow, col, G.values()[order], shape))
+    return tuple(res)
+
+def solutions(G, M_inv, E, epsilon, B1, B2) -> dict[str, torch.Tensor]:
+    stats = {}
+    solved = {
+        'schur': solve_schur(G, M_inv, E, B1, B2, stats=stats),
+        'cg': solve_cg(*csr(G), M_inv, epsilon, B1, B2,
+                       torch.zeros_like(B2), tolerance=1e-13,
+                       max_iterations=1000),
+        'schur_batch': solve_schur_batch(
+            G.to_dense().unsqueeze(0), M_inv.unsqueeze(0), E.unsqueeze(0),
+            B1.unsqueeze(0), B2.unsqueeze(0)
+        )[0],
+    }
+    assert stats['lstsq_fallbacks'] == 0
+    return solved
+
+def test_full_rank_matches_dense():
+    A, B, *args = system('ball')
+    reference = solve(A, B)
+    assert torch.allclose(
+        solve_batch(A.unsqueeze(0), B.unsqueeze(0))[0], reference,
+        rtol=0, atol=1e-12
+    )
+    for name, x in solutions(*args).items():
+        assert torch.allclose(x, reference, rtol=0, atol=1e-10), name
+
+def test_rank_deficient_hinge():
+    # the axis rows of a hinge have rank 2, the multipliers are not unique
+    # but the velocities are. the Tikhonov term of the schur solvers must
+    # still solve the system, with the dense minimum norm solution as the
+    # reference
+    A, B, G, *args = system('hinge')
+    assert torch.linalg.matrix_rank(A) < len(A)
+    reference = torch.linalg.lstsq(A, B, driver='gelsd').solution.squeeze()
+    k = G.shape[1]
+    for name, x in solutions(G, *args).items():
+        assert torch.allclose(x[:k], reference[:k], rtol=0, atol=1e-10), \
+            name
+        assert (A @ x.reshape(-1, 1) - B).abs().max() < 1e-10, name
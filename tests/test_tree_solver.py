@@ -0,0 +1,54 @@
+import pytest
+import torch
+
+import scene
+from simulation import Simulation
+
+def build(parts: list[dict], **kwargs) -> Simulation:
+    simul = Simulation(fps=60, **kwargs)
+    for part in parts:
+        scene.load(simul, part)
+    simul.init()
+    return simul
+
+def steps(simul: Simulation, n: int=10) -> torch.Tensor:
+    simul.step(n)
+    return torch.cat([simul.state.pos, simul.state.dir], dim=1)
+
+# every generated scene fixes its body 0, so the subtrees below it are
+# separate islands
+TREES = {
+    'hinge chain': [scene.chain(8, 'hinge')],
+    'ball tree': [scene.tree(15, 'ball')],
+    'universal tree': [scene.tree(7, 'universal')],
+    'forest': [
+        scene.chain(5, 'ball'),
+        scene.tree(7, 'hinge'),
+        scene.chain(4, 'fixed'),
+    ],
+}
+# without redundant rows the dense solver has the same unique solution
+FULL_RANK = ['ball tree', 'universal tree']
+
+@pytest.mark.parametrize('name', TREES)
+def test_matches_schur(name):
+    simul = build(TREES[name])
+    reference = build(TREES[name], tree_solver=False)
+    assert torch.allclose(steps(simul), steps(reference), rtol=0, atol=1e-10)
+    stats = simul.solver_stats
+    assert stats['tree_islands'] == stats['islands'] > 0
+    assert reference.solver_stats['tree_islands'] == 0
+
+@pytest.mark.parametrize('name', FULL_RANK)
+def test_matches_dense(name):
+    simul = build(TREES[name])
+    reference = build(TREES[name], solver='dense')
+    assert torch.allclose(steps(simul), steps(reference), rtol=0, atol=1e-10)
+
+def test_loop_falls_back():
+    # a grid has loops, its island is solved by the schur solver
+    simul = build([scene.grid(9, 'ball')])
+    reference = build([scene.grid(9, 'ball')], tree_solver=False)
+    assert torch.equal(steps(simul), steps(reference))
+    assert simul.solver_stats['islands'] == 1
+    assert simul.solver_stats['tree_islands'] == 0
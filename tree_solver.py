@@ -0,0 +1,291 @@
+import torch
+
+from island import Island
+from utils import tikhonov_shift
+
+
+class TreeSolver:
+    # solves the KKT system of islands whose body-joint graph is a tree in
+    # linear time (Baraff 1996). bodies and joints are the nodes of the
+    # tree, every node is padded to a 6 x 6 block. nodes are eliminated by
+    # tree contraction: every round removes all leaves and every other node
+    # of the paths at once, fill stays inside the tree and a chain of n
+    # bodies takes O(log n) rounds. the schedule only depends on the
+    # topology and is built once
+    def __init__(self,
+                 islands: list[Island],
+                 free_dofs: torch.Tensor,
+                 G_indices: torch.Tensor,
+                 row_joint: torch.Tensor,
+                 row_slot: torch.Tensor,
+                 M: torch.Tensor):
+        self._dofs = torch.cat([island.dofs for island in islands])
+        self._rows = torch.cat([island.rows for island in islands])
+        self._entries = torch.cat([island.entries for island in islands])
+
+        # nodes: bodies first, then joints
+        dof_body, self._dof_node = \
+            torch.unique(free_dofs[self._dofs] // 6, return_inverse=True)
+        self._dof_slot = free_dofs[self._dofs] % 6
+        row_joint, self._row_node = \
+            torch.unique(row_joint[self._rows], return_inverse=True)
+        self._row_slot = row_slot[self._rows]
+        num_bodies, num_joints = len(dof_body), len(row_joint)
+        num_nodes = num_bodies + num_joints
+
+        # edges: every joint-body pair that shares an entry of G
+        dof_pos = torch.full((len(free_dofs),), -1)
+        dof_pos[self._dofs] = torch.arange(len(self._dofs))
+        row_pos = torch.full((int(G_indices[0].max()) + 1,), -1)
+        row_pos[self._rows] = torch.arange(len(self._rows))
+        entry_rows = row_pos[G_indices[0, self._entries]]
+        entry_dofs = dof_pos[G_indices[1, self._entries]]
+
+        entry_joint = self._row_node[entry_rows]
+        entry_body = self._dof_node[entry_dofs]
+        edges, entry_edge = torch.unique(
+            entry_joint * num_bodies + entry_body, return_inverse=True
+        )
+        self._edge_joint = edges // num_bodies
+        self._edge_body = edges % num_bodies
+        self._entry_flat = 36 * entry_edge \
+            + 6 * self._row_slot[entry_rows] + self._dof_slot[entry_dofs]
+
+        self._num_islands = len(islands)
+        self._num_bodies = num_bodies
+        self._num_nodes = num_nodes
+        self._num_edges = len(edges)
+        self._schedule(islands)
+
+        # constant diagonal blocks, padding keeps every block invertible.
+        # every buffer takes the dtype of M
+        dtype = M.dtype
+        self._M_pad = torch.ones((num_bodies, 6), dtype=dtype)
+        self._M_pad[self._dof_node, self._dof_slot] = M[self._dofs]
+        self._M_inv_pad = torch.zeros((num_bodies, 6), dtype=dtype)
+        self._M_inv_pad[self._dof_node, self._dof_slot] = 1 / M[self._dofs]
+        self._row_mask = torch.zeros((num_joints, 6), dtype=torch.bool)
+        self._row_mask[self._row_node, self._row_slot] = True
+
+        # one extra node and two extra blocks absorb the missing second
+        # neighbour of leaves: a zero block and a block for discarded fill.
+        # the buffers are reset from templates on every solve
+        self._joint_nodes = num_bodies + self._row_node
+        self._D0 = torch.diag_embed(torch.cat([
+            self._M_pad,
+            -torch.ones((num_joints, 6), dtype=dtype),
+            torch.ones((1, 6), dtype=dtype)
+        ]))
+        self._Z0 = torch.zeros((num_nodes + 1, 6, 2), dtype=dtype)
+        self._Z0[self._joint_nodes, self._row_slot, 1] = 1
+        self._G = torch.zeros((self._num_edges, 6, 6), dtype=dtype)
+        self._D = torch.zeros_like(self._D0)
+        self._H = torch.zeros((self._num_blocks, 6, 6), dtype=dtype)
+        self._Z = torch.zeros_like(self._Z0)
+        self._x = torch.zeros_like(self._Z0)
+
+    @property
+    def dofs(self) -> torch.Tensor:
+        return self._dofs
+
+    @property
+    def rows(self) -> torch.Tensor:
+        return self._rows
+
+    @property
+    def num_islands(self) -> int:
+        return self._num_islands
+
+    @property
+    def num_rounds(self) -> int:
+        return len(self._rounds)
+
+    def solve(self,
+              values: torch.Tensor,
+              epsilon: float,
+              B1: torch.Tensor,
+              B2: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        # [[M, -G^T], [G, E]] [v, lambda] = [B1, B2] with E = epsilon * ones
+        # per island, returns v of dofs and lambda of rows. the system is
+        # solved in the symmetric form [[M, -G^T], [-G, -E]], E is added
+        # back by Sherman-Morrison
+        joint_nodes = self._joint_nodes
+        G = self._G
+        G.view(-1)[self._entry_flat] = values[self._entries]
+
+        # redundant rows (the hinge's axis rows have rank 2) and rows at a
+        # gimbal lock are regularized by a Tikhonov term at the rounding
+        # level. it only moves lambda along directions that G^T maps to zero
+        S_diag = G.new_zeros((len(self._row_mask), 6)).index_add_(
+            0,
+            self._edge_joint,
+            (G ** 2 * self._M_inv_pad[self._edge_body].unsqueeze(-2)).sum(-1)
+        )
+        delta = tikhonov_shift(S_diag)
+
+        D = self._D
+        D.copy_(self._D0)
+        D[joint_nodes, self._row_slot, self._row_slot] = \
+            -delta[self._row_node, self._row_slot]
+        H = self._H
+        H.zero_()
+        torch.neg(G, out=H[:self._num_edges])
+
+        # right hand sides: the system and the ones vector of E
+        Z = self._Z
+        Z.copy_(self._Z0)
+        Z[self._dof_node, self._dof_slot, 0] = B1.reshape(-1)[self._dofs]
+        Z[joint_nodes, self._row_slot, 0] = -B2.reshape(-1)[self._rows]
+
+        # eliminate node i into its neighbours a and b:
+        # D_a -= H_ai D_i^-1 H_ia, H_ab -= H_ai D_i^-1 H_ib, z_a -= ...
+        factors = []
+        for node, a, b, block_a, flip_a, block_b, flip_b, fill \
+                in self._rounds:
+            # strided batched matmuls are far slower, keep them contiguous
+            H_a, H_b = H[block_a], H[block_b]
+            H_ai = torch.where(flip_a, H_a.mT, H_a).contiguous()
+            H_bi = torch.where(flip_b, H_b.mT, H_b).contiguous()
+            X = torch.linalg.solve(
+                D[node], torch.cat([H_ai.mT, H_bi.mT, Z[node]], dim=-1)
+            ).contiguous()
+            W_a = H_ai @ X
+            W_b = H_bi @ X
+            D.index_add_(0, a, W_a[..., :6], alpha=-1)
+            D.index_add_(0, b, W_b[..., 6:12], alpha=-1)
+            H.index_add_(0, fill, W_a[..., 6:12], alpha=-1)
+            Z.index_add_(0, a, W_a[..., 12:], alpha=-1)
+            Z.index_add_(0, b, W_b[..., 12:], alpha=-1)
+            factors.append(X)
+
+        # back substitution: x_i = D_i^-1 (z_i - H_ia x_a - H_ib x_b)
+        x = self._x
+        x[self._roots] = torch.linalg.solve(D[self._roots], Z[self._roots])
+        for (node, a, b, *_), X in zip(reversed(self._rounds),
+                                       reversed(factors)):
+            x[node] = X[..., 12:] - X[..., :6] @ x[a] - X[..., 6:12] @ x[b]
+
+        # Sherman-Morrison per island for -epsilon * u u^T
+        sums = x.new_zeros((self._num_islands, 2)).index_add_(
+            0,
+            self._node_island[joint_nodes],
+            x[joint_nodes, self._row_slot]
+        )
+        scale = epsilon * sums[:, 0] / (1 - epsilon * sums[:, 1])
+        x = x[..., 0] + scale[self._node_island].reshape(-1, 1) * x[..., 1]
+
+        return (x[self._dof_node, self._dof_slot],
+                x[joint_nodes, self._row_slot])
+
+    def _schedule(self, islands: list[Island]) -> None:
+        num_nodes, num_edges = self._num_nodes, self._num_edges
+        dummy, zero_block = num_nodes, num_edges
+
+        # edge blocks hold H[u, v], base edges are H[joint, body] = -G
+        ends = [
+            (self._num_bodies + joint, body) for joint, body in zip(
+                self._edge_joint.tolist(), self._edge_body.tolist()
+            )
+        ]
+        neighbours: list[dict[int, int]] = [{} for _ in range(num_nodes)]
+        for block, (u, v) in enumerate(ends):
+            neighbours[u][v] = block
+            neighbours[v][u] = block
+        ends += [(dummy, dummy), (dummy, dummy)]
+
+        # the island of a node, every island contracts to one root
+        self._node_island = torch.zeros((num_nodes + 1,), dtype=torch.long)
+        self._node_island[self._dof_node] = torch.cat([
+            torch.full((len(island.dofs),), i)
+            for i, island in enumerate(islands)
+        ])
+        self._node_island[self._num_bodies + self._row_node] = torch.cat([
+            torch.full((len(island.rows),), i)
+            for i, island in enumerate(islands)
+        ])
+
+        # the pivot of a joint is only -delta until some node has been
+        # eliminated into it, such joints wait unless nothing else is left
+        absorbed = [node < self._num_bodies for node in range(num_nodes)]
+
+        self._rounds = []
+        remaining = set(range(num_nodes))
+        while True:
+            # an independent set of leaves and path nodes, leaves first
+            candidates = sorted(
+                (node for node in remaining
+                 if 1 <= len(neighbours[node]) <= 2),
+                key=lambda node: len(neighbours[node])
+            )
+            if not candidates:
+                break
+            candidates = [
+                node for node in candidates if absorbed[node]
+            ] or candidates
+
+            blocked = set()
+            chosen = []
+            for node in candidates:
+                if node in blocked:
+                    continue
+                chosen.append(node)
+                blocked.add(node)
+                blocked.update(neighbours[node])
+
+            columns = [[] for _ in range(8)]
+            for node in chosen:
+                (a, block_a), *rest = neighbours[node].items()
+                b, block_b = rest[0] if rest else (dummy, zero_block)
+                if rest:
+                    fill = len(ends)
+                    ends.append((a, b))
+                    neighbours[a][b] = fill
+                    neighbours[b][a] = fill
+                    del neighbours[b][node]
+                else:
+                    fill = zero_block + 1
+                del neighbours[a][node]
+                neighbours[node] = {}
+                remaining.discard(node)
+                absorbed[a] = True
+                if rest:
+                    absorbed[b] = True
+
+                row = (
+                    node, a, b,
+                    block_a, ends[block_a][0] != a,
+                    block_b, b != dummy and ends[block_b][0] != b,
+                    fill
+                )
+                for column, value in zip(columns, row):
+                    column.append(value)
+
+            self._rounds.append(tuple(
+                torch.as_tensor(column).reshape(-1, 1, 1) if i in (4, 6)
+                else torch.as_tensor(column)
+                for i, column in enumerate(columns)
+            ))
+
+        self._roots = torch.as_tensor(sorted(remaining))
+        self._num_blocks = len(ends)
+
+    @staticmethod
+    def is_tree(island: Island,
+                free_dofs: torch.Tensor,
+                G_indices: torch.Tensor,
+                row_joint: torch.Tensor) -> bool:
+        # a connected graph is a tree iff it has one edge less than nodes
+        rows, cols = G_indices[:, island.entries]
+        joints = row_joint[rows]
+        bodies = free_dofs[cols] // 6
+        # a joint touches at most its two bodies, so its edges are the ones
+        # to its first and last body. counted without sorting the entries
+        num_joints = int(row_joint.max()) + 1
+        first = torch.full((num_joints,), int(bodies.max()) + 1) \
+            .scatter_reduce(0, joints, bodies, 'amin')
+        last = torch.full((num_joints,), -1) \
+            .scatter_reduce(0, joints, bodies, 'amax')
+        used = last >= 0
+        num_edges = int(used.sum()) + int((first != last)[used].sum())
+        num_nodes = int(used.sum()) + int((torch.bincount(bodies) > 0).sum())
+        return num_edges == num_nodes - 1
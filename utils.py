@@ -1,26 +1,90 @@
+import gc
 import torch
-from typing import Union, Iterable
-from vpython import vector
+import warnings
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from vpython import vector
 
 # convert functions
-def convert_to_tensor(vec: Union[vector, Iterable]) -> torch.Tensor:
-    if isinstance(vec, vector):
-        return torch.as_tensor(vec.value, dtype=torch.float64)
+def convert_to_tensor(vec: Iterable,
+                      dtype: torch.dtype=torch.float64) -> torch.Tensor:
+    # vpython vectors are accepted without importing vpython
+    if hasattr(vec, 'value'):
+        return torch.as_tensor(vec.value, dtype=dtype)
     else:
-        return torch.as_tensor(vec, dtype=torch.float64)
+        return torch.as_tensor(vec, dtype=dtype)
+
+def convert_to_vector(value: Iterable[float]) -> 'vector':
+    from vpython import vector
 
-def convert_to_vector(value: Iterable[float]) -> vector:
     assert len(value) == 3
-    return vector(*value)
+    return vector(*map(float, value))
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    # for making many small objects at once, e.g. in create_many. they
+    # hold no cycles, but every few thousand of them the collector would
+    # walk the whole heap
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 # matrix functions
 def skew_matrix(vec: torch.Tensor) -> torch.Tensor:
-    x, y, z = vec
-    return torch.as_tensor([
-        [0, -z, y],
-        [z, 0, -x],
-        [-y, x, 0],
-    ])
+    # batched over the leading dimensions of vec (... x 3)
+    x, y, z = vec.unbind(-1)
+    zeros = torch.zeros_like(x)
+    return torch.stack([
+        torch.stack([zeros, -z, y], dim=-1),
+        torch.stack([z, zeros, -x], dim=-1),
+        torch.stack([-y, x, zeros], dim=-1),
+    ], dim=-2)
+
+def mat_vec(mat: torch.Tensor, vec: torch.Tensor) -> torch.Tensor:
+    # batched (... x 3 x 3) @ (... x 3)
+    return (mat @ vec.unsqueeze(-1)).squeeze(-1)
+
+def rotation_matrix(dir: torch.Tensor) -> torch.Tensor:
+    # batched over the leading dimensions of dir (... x 3)
+    x, y, z = dir.unbind(-1)
+    cx, sx = torch.cos(x), torch.sin(x)
+    cy, sy = torch.cos(y), torch.sin(y)
+    cz, sz = torch.cos(z), torch.sin(z)
+    return torch.stack([
+        torch.stack([
+             cz * cx - cy * sx * sz,
+            -sz * cx - cy * sx * cz,
+             sy * sx
+        ], dim=-1),
+        torch.stack([
+             cz * sx + cy * cx * sz,
+            -sz * sx + cy * cx * cz,
+            -sy * cx
+        ], dim=-1),
+        torch.stack([
+            sy * sz,
+            sy * cz,
+            cy
+        ], dim=-1),
+    ], dim=-2)
+
+def ang_vel_coeff_matrix(dir: torch.Tensor) -> torch.Tensor:
+    # batched over the leading dimensions of dir (... x 3)
+    x, y, _ = dir.unbind(-1)
+    cx, sx = torch.cos(x), torch.sin(x)
+    cy, sy = torch.cos(y), torch.sin(y)
+    zeros, ones = torch.zeros_like(x), torch.ones_like(x)
+    return torch.stack([
+        torch.stack([zeros, cx,  sy * sx], dim=-1),
+        torch.stack([zeros, sx, -sy * cx], dim=-1),
+        torch.stack([ones,  zeros,    cy], dim=-1),
+    ], dim=-2)
 
 # linalg functions
 def get_bases(bases: torch.Tensor) -> torch.Tensor:
@@ -30,19 +94,206 @@ def get_bases(bases: torch.Tensor) -> torch.Tensor:
         for j in range(i + 1, n):
             assert torch.dot(bases[i], bases[j]) != 0, "Bases not orthogonal"
 
-    A = torch.eye(dim)
+    A = torch.eye(dim, dtype=bases.dtype)
     A[:, :n] = bases.T
 
     Q, R = torch.qr(A)
     return Q.T
 
-def solve(A: torch.Tensor, B: torch.Tensor) -> torch.Tensor:
-    P, L, U = torch.linalg.lu(A)
+# physics shared by the solvers and the batched and differentiable steps
+GRAVITY = 9.80665
+
+def dof_gravity(dof_mass: torch.Tensor) -> torch.Tensor:
+    # weight of every dof from (... x 6n) dof masses, on the y dofs
+    gravity = torch.zeros_like(dof_mass)
+    gravity[..., 1::6] = dof_mass[..., 1::6] * GRAVITY
+    return gravity
+
+def tikhonov_shift(diag: torch.Tensor) -> torch.Tensor:
+    # for the (... x m) diagonals of Schur complements: a Tikhonov term at
+    # the rounding level, so redundant rows (the hinge's axis rows have
+    # rank 2) still factor. it only moves lambda along directions that
+    # G^T maps to zero
+    finfo = torch.finfo(diag.dtype)
+    return 64 * finfo.eps * (diag + diag.mean(dim=-1, keepdim=True)) \
+        + finfo.tiny
 
-    diag_U = torch.diag(U)
+# CSR layout of the sparse pattern `indices` (2 x nnz, no duplicates):
+# crow and col indices, and the order taking values from the order of
+# `indices` to the CSR one
+def csr_layout(indices: torch.Tensor,
+               shape: tuple[int, int]
+               ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    rows, cols = indices
+    order = torch.argsort(rows * shape[1] + cols)
+    crow = torch.zeros((shape[0] + 1,), dtype=int)
+    torch.cumsum(torch.bincount(rows, minlength=shape[0]), 0, out=crow[1:])
+    return crow, cols[order], order
+
+def sparse_csr(crow: torch.Tensor,
+               col: torch.Tensor,
+               values: torch.Tensor,
+               shape: tuple[int, int]) -> torch.Tensor:
+    # shares `values`, so writing into it changes the matrix. torch warns
+    # once that CSR is in beta, nothing a caller can act on
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', 'Sparse CSR tensor support')
+        return torch.sparse_csr_tensor(
+            crow, col, values, shape, check_invariants=False
+        )
+
+# the solvers add what they had to work around to `stats`, if given
+def solve(A: torch.Tensor,
+          B: torch.Tensor,
+          stats: Optional[dict]=None) -> torch.Tensor:
+    LU, pivots, _ = torch.linalg.lu_factor_ex(A)
+
+    diag_U = torch.diagonal(LU)
     zeros = torch.zeros_like(diag_U)
-    non_singular_rows = (~torch.isclose(diag_U, zeros)).nonzero().squeeze()
+    singular = torch.isclose(diag_U, zeros)
+    if stats is not None:
+        stats['rows_dropped'] = int(singular.sum())
+    if not singular.any():
+        return torch.squeeze(torch.linalg.lu_solve(LU, pivots, B))
+
+    # drop singular rows, their unknowns are left at zero
+    non_singular_rows = (~singular).nonzero().squeeze(1)
     A = A[non_singular_rows][:, non_singular_rows]
-    B = B[non_singular_rows]
+    x = torch.zeros_like(B)
+    x[non_singular_rows] = torch.linalg.solve(A, B[non_singular_rows])
+
+    return torch.squeeze(x)
+
+def solve_schur(G: torch.Tensor,
+                M_inv: torch.Tensor,
+                E: torch.Tensor,
+                B1: torch.Tensor,
+                B2: torch.Tensor,
+                stats: Optional[dict]=None) -> torch.Tensor:
+    # [[M, -G^T], [G, E]] x = [B1, B2] with diagonal M, reduced to the
+    # constraint space: (G M^-1 G^T + E) lambda = B2 - G M^-1 B1
+    G = G.coalesce()
+    cols = G.indices()[1]
+    G_scaled = torch.sparse_coo_tensor(
+        G.indices(), G.values() * M_inv[cols], G.shape, check_invariants=False
+    )
+
+    S = torch.sparse.mm(G_scaled, G.t()).to_dense() + E
+    rhs = B2 - torch.sparse.mm(G, M_inv.reshape(-1, 1) * B1)
+
+    # redundant rows get a Tikhonov term, as in TreeSolver, so S factors
+    delta = tikhonov_shift(S.diagonal())
+    L, info = torch.linalg.cholesky_ex(S + torch.diag(delta))
+    if stats is not None:
+        stats['lstsq_fallbacks'] = int(info != 0)
+    if info == 0:
+        lam = torch.cholesky_solve(rhs, L)
+    else:
+        # not even that, fall back to the minimum norm multipliers
+        lam = torch.linalg.lstsq(S, rhs, driver='gelsd').solution
+
+    v = M_inv.reshape(-1, 1) * (B1 + torch.sparse.mm(G.t(), lam))
+    return torch.squeeze(torch.vstack([v, lam]))
+
+def solve_cg(G: torch.Tensor,
+             G_T: torch.Tensor,
+             M_inv: torch.Tensor,
+             epsilon: float,
+             B1: torch.Tensor,
+             B2: torch.Tensor,
+             lambda_0: torch.Tensor,
+             tolerance: float=1e-6,
+             max_iterations: int=200,
+             stats: Optional[dict]=None) -> torch.Tensor:
+    # same system as solve_schur with E = epsilon * ones, solved by Jacobi
+    # preconditioned conjugate gradient from lambda_0 without forming S.
+    # G and G_T are CSR (see Island.G_csr), their products are several
+    # times faster than COO ones
+    M_inv = M_inv.reshape(-1, 1)
+
+    def S(x: torch.Tensor) -> torch.Tensor:
+        return G @ (M_inv * (G_T @ x)) + epsilon * x.sum()
+
+    G_squared = sparse_csr(
+        G.crow_indices(), G.col_indices(), G.values() ** 2, G.shape
+    )
+    diag = (G_squared @ M_inv).reshape(-1) + epsilon
+    P_inv = torch.where(diag > 0, 1 / diag, 0).reshape(-1, 1)
+
+    rhs = B2 - G @ (M_inv * B1)
+    norm_rhs = max(float(torch.linalg.norm(rhs)), 1e-300)
+
+    lam = lambda_0.reshape(-1, 1).clone()
+    r = rhs - S(lam)
+    z = P_inv * r
+    p = z
+    rz = float(torch.sum(r * z))
+    residual = float(torch.linalg.norm(r))
+
+    iteration = 0
+    while residual > tolerance * norm_rhs and iteration < max_iterations:
+        Sp = S(p)
+        pSp = float(torch.sum(p * Sp))
+        if pSp <= 0:
+            # no descent left in a rank deficient direction
+            break
+        alpha = rz / pSp
+        lam += alpha * p
+        r -= alpha * Sp
+        z = P_inv * r
+        rz, rz_before = float(torch.sum(r * z)), rz
+        p = z + rz / rz_before * p
+        residual = float(torch.linalg.norm(r))
+        iteration += 1
+
+    if stats is not None:
+        stats['cg_iterations'] = iteration
+        stats['cg_residual'] = residual / norm_rhs
+
+    v = M_inv * (B1 + G_T @ lam)
+    return torch.squeeze(torch.vstack([v, lam]))
+
+# batched solvers, every leading index is an independent system
+def solve_batch(A: torch.Tensor, B: torch.Tensor) -> torch.Tensor:
+    # the policy of solve: rows with a zero pivot are dropped and their
+    # unknowns left at zero. dropped rows and columns become identity ones,
+    # so all worlds are still solved in one call
+    LU, pivots, _ = torch.linalg.lu_factor_ex(A)
+
+    diag_U = torch.diagonal(LU, dim1=-2, dim2=-1)
+    singular = torch.isclose(diag_U, torch.zeros_like(diag_U))
+    if not singular.any():
+        return torch.linalg.lu_solve(LU, pivots, B).squeeze(-1)
+
+    keep = ~singular
+    A = torch.where(
+        keep.unsqueeze(-1) & keep.unsqueeze(-2),
+        A,
+        torch.diag_embed(singular.to(A.dtype))
+    )
+    B = torch.where(keep.unsqueeze(-1), B, 0)
+    return torch.linalg.solve(A, B).squeeze(-1)
+
+def solve_schur_batch(G: torch.Tensor,
+                      M_inv: torch.Tensor,
+                      E: torch.Tensor,
+                      B1: torch.Tensor,
+                      B2: torch.Tensor) -> torch.Tensor:
+    # dense G (b x m x k), M_inv (b x k), same system as solve_schur
+    G_scaled = G * M_inv.unsqueeze(-2)
+    S = G_scaled @ G.mT + E
+    rhs = B2 - G_scaled @ B1
+
+    # the Tikhonov term of solve_schur, per world
+    delta = tikhonov_shift(torch.diagonal(S, dim1=-2, dim2=-1))
+    L, info = torch.linalg.cholesky_ex(S + torch.diag_embed(delta))
+    lam = torch.cholesky_solve(rhs, L)
+
+    singular = info != 0
+    if singular.any():
+        lam[singular] = torch.linalg.lstsq(
+            S[singular], rhs[singular], driver='gelsd'
+        ).solution
 
-    return torch.squeeze(torch.linalg.solve(A, B))
\ No newline at end of file
+    v = M_inv.unsqueeze(-1) * (B1 + G.mT @ lam)
+    return torch.cat([v, lam], dim=-2).squeeze(-1)